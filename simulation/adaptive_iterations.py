@@ -0,0 +1,82 @@
+import collections
+from running_stats import RunningStats
+from sweep import Sweep
+
+
+class AdaptiveIterations:
+    """
+    Sequential stopping of iterations (seeds) per configuration cell of an adaptive sweep. Route duration of
+    every finished iteration updates running mean and variance of its cell. New iterations of a cell are
+    scheduled until the confidence interval of the mean duration is narrower than ci_width steps (after at
+    least min_iterations) or max_iterations are run, so iterations are spent on noisy cells. First
+    min_iterations of a cell run together, after that a new iteration is scheduled only when no iteration
+    of the cell is running, so a converged cell does not get extra iterations.
+    """
+    def __init__(self, sweep):
+        self.sweep = sweep
+        self.ci_width = float(sweep.adaptive['ci_width'])
+        self.confidence = sweep.adaptive.get('confidence', 0.95)
+        self.min_iterations = sweep.adaptive.get('min_iterations', 3)
+
+        # configuration cell: its cells ordered by seed
+        self.cells = collections.OrderedDict()
+        for cell in sweep.get_cells():
+            self.cells.setdefault(Sweep.get_config_key(cell), []).append(cell)
+        self.stats = {key: RunningStats() for key in self.cells}
+        self.next_index = {key: 0 for key in self.cells}
+        self.in_flight = {key: 0 for key in self.cells}
+
+        # Iterations completed by previous runs of the sweep
+        for key, cells in self.cells.iteritems():
+            while self.next_index[key] < len(cells) and self.sweep.get_cell_hash(cells[self.next_index[key]]) \
+                    in self.sweep.completed:
+                route_duration = self.sweep.records[self.sweep.get_cell_hash(cells[self.next_index[key]])] \
+                    .get('route_duration')
+                if route_duration is not None:
+                    self.stats[key].add(route_duration)
+                self.next_index[key] += 1
+
+    def is_converged(self, key):
+        return self.stats[key].n >= self.min_iterations and \
+            self.stats[key].get_ci_width(self.confidence) <= self.ci_width
+
+    def get_initial_cells(self):
+        """ Iterations which are missing to min_iterations (at least one) of every not converged cell. """
+        cells = []
+        for key in self.cells:
+            if not self.is_converged(key):
+                for _ in range(0, max(1, self.min_iterations - self.stats[key].n)):
+                    cells += self._next_cells(key)
+        return cells
+
+    def add_result(self, cell, route_duration):
+        """ Returns next iteration of the cell, if it is still needed. """
+        key = Sweep.get_config_key(cell)
+        self.in_flight[key] -= 1
+        if route_duration is not None:
+            self.stats[key].add(route_duration)
+        if self.stats[key].n + self.in_flight[key] < self.min_iterations:
+            # Failed iteration is replaced by the next seed
+            return self._next_cells(key)
+        if self.in_flight[key] > 0 or self.is_converged(key):
+            return []
+        return self._next_cells(key)
+
+    def get_num_of_remaining(self):
+        """ Upper bound of iterations, which can still be scheduled. """
+        return sum(len(cells) - self.next_index[key] for key, cells in self.cells.iteritems()
+                   if not self.is_converged(key))
+
+    def _next_cells(self, key):
+        if self.next_index[key] >= len(self.cells[key]):
+            return []
+        self.next_index[key] += 1
+        self.in_flight[key] += 1
+        return [self.cells[key][self.next_index[key] - 1]]
+
+    def print_summary(self):
+        print("Configuration,Iterations,Mean route duration,CI width,Converged")
+        for key in self.cells:
+            stats = self.stats[key]
+            print("{},{},{:.1f},{:.1f},{}".format(key, stats.n, stats.mean, stats.get_ci_width(self.confidence),
+                                                  self.is_converged(key)))
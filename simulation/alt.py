@@ -2,12 +2,12 @@ import traci
 import time
 import random
 import heapq
-import matplotlib.pyplot as plt
 import numpy as np
 from settings import PathFinderMode
 from settings import GeneralSettings
 from road_map_data import RoadMapData
 from collections import defaultdict
+from plot_jobs import PlotJobs
 
 
 class Alt:
@@ -73,10 +73,7 @@ class Alt:
         if GeneralSettings.debug_plot:
             nodes = np.array([node.getCoord() for node in RoadMapData.road_map.getNodes()])
             tmp = np.array([l.getCoord() for l in landmarks])
-            plt.figure(figsize=(15, 15))
-            plt.plot(nodes[:, 0], nodes[:, 1], 'bo', tmp[:, 0], tmp[:, 1], 'ro')
-            plt.savefig('{}.png'.format(GeneralSettings.debug_output_dir + '/ALT-landmarks'))
-            plt.close('all')
+            PlotJobs.save_landmarks(nodes, tmp)
 
     @staticmethod
     def _min_landmark_approx(s, t):
@@ -0,0 +1,65 @@
+import os
+import cPickle as pickle
+import shutil
+
+
+class Checkpoint:
+    """
+    Periodic snapshot of a running simulation. Every checkpoint is written into its own
+    step_<n> directory and the 'latest' file is switched only after both the SUMO state
+    and the controller state are on disk, so a crash while saving keeps the previous one.
+    """
+    latest_file_name = 'latest'
+    sumo_state_file_name = 'sumo_state.xml'
+    controller_state_file_name = 'controller_state.pkl'
+
+    @staticmethod
+    def save(directory, step, traci_conn, controller_state):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        step_dir_name = 'step_{}'.format(step)
+        step_dir = os.path.join(directory, step_dir_name)
+        if not os.path.isdir(step_dir):
+            os.makedirs(step_dir)
+
+        traci_conn.simulation.saveState(os.path.join(step_dir, Checkpoint.sumo_state_file_name))
+        with open(os.path.join(step_dir, Checkpoint.controller_state_file_name), 'wb') as f:
+            pickle.dump({'step': step, 'controller': controller_state}, f, pickle.HIGHEST_PROTOCOL)
+
+        prev_step_dir_name = Checkpoint._read_latest(directory)
+        tmp_latest = os.path.join(directory, Checkpoint.latest_file_name + '.tmp')
+        with open(tmp_latest, 'w') as f:
+            f.write(step_dir_name)
+        latest = os.path.join(directory, Checkpoint.latest_file_name)
+        if os.path.isfile(latest):
+            os.remove(latest)
+        os.rename(tmp_latest, latest)
+
+        if prev_step_dir_name and prev_step_dir_name != step_dir_name:
+            shutil.rmtree(os.path.join(directory, prev_step_dir_name), ignore_errors=True)
+
+    @staticmethod
+    def load(directory):
+        """ Returns (sumo state file path, step, controller state) or None if there is no checkpoint. """
+        step_dir_name = Checkpoint._read_latest(directory)
+        if not step_dir_name:
+            return None
+
+        step_dir = os.path.join(directory, step_dir_name)
+        with open(os.path.join(step_dir, Checkpoint.controller_state_file_name), 'rb') as f:
+            data = pickle.load(f)
+        return os.path.join(step_dir, Checkpoint.sumo_state_file_name), data['step'], data['controller']
+
+    @staticmethod
+    def clear(directory):
+        if os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    @staticmethod
+    def _read_latest(directory):
+        latest = os.path.join(directory, Checkpoint.latest_file_name)
+        if not os.path.isfile(latest):
+            return None
+        with open(latest) as f:
+            return f.read().strip()
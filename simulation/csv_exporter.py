@@ -1,20 +1,20 @@
 import uuid
+import numpy as np
 from settings import GeneralSettings
 
 
 class CsvExporter:
 
-    # Used only in single simulation mode
+    # Used only in single simulation mode, queue data is LaneQueueData
     @staticmethod
     def export_traffic_lights_per_lane_queues(queue_data, tls_ids, tls_controlled_lanes):
         if GeneralSettings.export_tl_per_lane:
             for tl_id in tls_ids:
                 f = open('{}.csv'.format(GeneralSettings.statistics_output_dir + '/queues_' + tl_id),
                          'w')
-                f.write("time step," + ",".join(tls_controlled_lanes[tl_id]) + "\n")
-                for j, tl_lanes in enumerate(queue_data):
-                    values = ",".join([str(tl_lanes[tl_id][cl]) for cl in tls_controlled_lanes[tl_id]])
-                    f.write(str(j) + "," + values + "\n")
+                lanes = list(tls_controlled_lanes[tl_id])
+                f.write("time step," + ",".join(lanes) + "\n")
+                CsvExporter._write_lane_queues(f, queue_data.get_lanes(lanes))
                 f.close()
 
     # Used only in parallel run mode
@@ -29,12 +29,17 @@ class CsvExporter:
                 )
                 f = open('{}.csv'.format(GeneralSettings.statistics_output_dir + '/' + file_name),
                          'w')
-                f.write("time step," + ",".join(tls_controlled_lanes[tl_id]) + "\n")
-                for j, tl_lanes in enumerate(queue_data):
-                    values = ",".join([str(tl_lanes[tl_id][cl]) for cl in tls_controlled_lanes[tl_id]])
-                    f.write(str(j) + "," + values + "\n")
+                lanes = list(tls_controlled_lanes[tl_id])
+                f.write("time step," + ",".join(lanes) + "\n")
+                CsvExporter._write_lane_queues(f, queue_data.get_lanes(lanes))
                 f.close()
 
+    @staticmethod
+    def _write_lane_queues(f, lane_queues):
+        time_steps = np.arange(lane_queues.shape[0]).reshape(-1, 1)
+        np.savetxt(f, np.hstack((time_steps, lane_queues)), fmt=['%d'] + ['%g'] * lane_queues.shape[1],
+                   delimiter=',')
+
     @staticmethod
     def export_vehicle_stats(speed, wait_time, allowed_speed, vehicle):
         if GeneralSettings.export_vehicle_stats:
@@ -48,8 +53,9 @@ class CsvExporter:
                         'id_' + vehicle.id
             f = open('{}.csv'.format(GeneralSettings.statistics_output_dir + '/' + file_name), 'w')
             f.write("time step,vehicle speed,wait time,allowed speed\n")
-            for i in range(0, len(speed)):
-                f.write('{},{},{},{}\n'.format(i + start_delay, speed[i] * 3.6, wait_time[i], allowed_speed[i] * 3.6))
+            time_steps = np.arange(start_delay, start_delay + len(speed))
+            np.savetxt(f, np.column_stack((time_steps, speed * 3.6, wait_time, allowed_speed * 3.6)),
+                       fmt=('%d', '%g', '%g', '%g'), delimiter=',')
             f.close()
 
     @staticmethod
@@ -63,7 +69,8 @@ class CsvExporter:
                 '_id_' + vehicle.id
             f = open('{}.csv'.format(GeneralSettings.statistics_output_dir + '/' + file_name), 'w')
             for tl_key, tl_data in queue_data.iteritems():
-                f.write(tl_key + ',' + ','.join(map(str, tl_data)) + '\n')
+                f.write(tl_key + ',')
+                np.savetxt(f, tl_data.reshape(1, -1), fmt='%d', delimiter=',')
             f.close()
 
     @staticmethod
@@ -120,6 +127,6 @@ class CsvExporter:
             f = open('{}.csv'.format(GeneralSettings.statistics_output_dir + '/rtc_logs'), 'w')
             f.write("step,vehicle id,action,tl id,preemption mode,msg\n")
             for data in log_data:
-                f.write("{},{},{},{},{},{}\n".format(data['step'], data['vehicle_id'], data['action'], data['tl_id'],
-                                                     data['preemption_mode'], data['msg']))
+                f.write("{},{},{},{},{},{}\n".format(data.step, data.vehicle_id, data.action, data.tl_id,
+                                                     data.preemption_mode, data.msg))
             f.close()
@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class GrowableBuffer(object):
+    """
+    Typed append-only array with amortized growth (capacity doubles when full). Filled part is exposed as a
+    NumPy view, so exporters and plots consume it without conversion.
+    """
+    __slots__ = ('data', 'size')
+
+    def __init__(self, dtype, capacity=256):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        # Only the filled part is stored
+        return self.view().copy()
+
+    def __setstate__(self, data):
+        self.data = data
+        self.size = len(data)
+
+    def _reserve(self, size):
+        if size > len(self.data):
+            data = np.zeros(max(size, 2 * len(self.data), 1), dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+
+    def append(self, value):
+        if self.size == len(self.data):
+            self._reserve(self.size + 1)
+        self.data[self.size] = value
+        self.size += 1
+
+    def extend_zeros(self, num_of_values):
+        self._reserve(self.size + num_of_values)
+        self.data[self.size:self.size + num_of_values] = 0
+        self.size += num_of_values
+
+    def view(self):
+        return self.data[:self.size]
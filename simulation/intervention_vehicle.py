@@ -1,18 +1,22 @@
-import collections
-import numpy
 import uuid
-import operator
-import copy
-import itertools
 
 from settings import PreemptionMode, PathFinderMode, PathFinderAlgorithm, ResetMode, GeneralSettings
 from tl_controller import TrafficLightsController
 from road_map_data import RoadMapData
 from preemption_request import PreemptionRequest
 from vehicle_stats import Stats
+from preemption_plan import PreemptionPlan
+from route_cursor import RouteCursor
+from route_geometry import RouteGeometry
 
 
-class InterventionVehicle:
+class InterventionVehicle(object):
+    __slots__ = ('traci_conn', 'rtc_conn', 'id', 'route_name', 'start_node', 'destination_node', 'start_delay',
+                 'edge_list', 'remaining_edges', 'route_id', 'route_tls', 'route_tl_plans', 'tl_plans',
+                 'current_edge_index', 'route_cursor', 'route_geometry', 'route_position', 'route_tl_stop_indexes',
+                 'tl_stop_indexes', 'is_one_way', 'color', 'preemption_mode', 'reset_mode', 'path_finder_mode',
+                 'path_finder_algorithm', 'stats', 'is_active', 'is_finished', 'tl_controller')
+
     def __init__(self, traci_conn, rtc_conn, route_data, start_delay, preemption_mode, reset_mode, path_finder_mode,
                  path_finder_algorithm):
         self.traci_conn = traci_conn
@@ -26,7 +30,14 @@ class InterventionVehicle:
         self.remaining_edges = None
         self.route_id = None
         self.route_tls = None
+        self.route_tl_plans = None
+        self.tl_plans = None
         self.current_edge_index = None
+        self.route_cursor = None
+        self.route_geometry = None
+        self.route_position = None
+        self.route_tl_stop_indexes = None
+        self.tl_stop_indexes = None
         self.is_one_way = route_data['is_one_way']
         self.color = (255, 0, 0, 0)
         self.preemption_mode = PreemptionMode(preemption_mode)
@@ -38,16 +49,37 @@ class InterventionVehicle:
         self.is_finished = False
         self.tl_controller = TrafficLightsController(route_data['preemption_range'])
 
+    def __getstate__(self):
+        # Connections are not serializable, they are set again after checkpoint restore. Edges link the whole
+        # network graph, route keeps only their ids and edges are looked up in the road map on restore.
+        return {name: getattr(self, name) for name in self.__slots__
+                if name not in ('traci_conn', 'rtc_conn', 'edge_list')}
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+        self.traci_conn = None
+        self.rtc_conn = None
+        self.edge_list = [RoadMapData.road_map.getEdge(edge_id) for edge_id in self.remaining_edges] \
+            if self.remaining_edges is not None else None
+
+    def set_connections(self, traci_conn, rtc_conn):
+        self.traci_conn = traci_conn
+        self.rtc_conn = rtc_conn
+
     def set_route(self, edge_list):
         self.route_id = str(uuid.uuid4())
         self.edge_list = edge_list
         self.remaining_edges = [edge.getID() for edge in self.edge_list]
         self.current_edge_index = 0
         self.route_tls = {i: edge.getTLS().getID() for i, edge in enumerate(self.edge_list) if edge.getTLS()}
-        self.stats.tls_on_the_route = itertools.chain(self.stats.tls_on_the_route,
-                                                      copy.deepcopy(self.route_tls.values()))
-        total_length = sum([edge.getLength() for edge in self.edge_list])
-        self.calc_route_stats(edge_list)
+        self.route_cursor = RouteCursor(self.remaining_edges, self.route_tls)
+        self.route_geometry = RouteGeometry(self.edge_list)
+        self.route_position = 0.
+        self.stats.tls_on_the_route.extend(self.route_tls.values())
+        self._prepare_preemption_plans()
+        total_length = self.route_geometry.get_total_length()
+        self.calc_route_stats()
         print_str = "Set route of {} edges, {} tls and total length of {} meters.".format(len(edge_list),
                                                                                           len(self.route_tls),
                                                                                           total_length)
@@ -55,9 +87,38 @@ class InterventionVehicle:
         print ("Route: {}; {}".format(self.route_name, print_str))
         self.traci_conn.route.add(self.route_id, self.remaining_edges)
 
-    def calc_route_stats(self, edges):
-        time = sum([edge.getLength() / edge.getSpeed() for edge in edges])
-        length = sum([edge.getLength() for edge in edges])
+    def _prepare_preemption_plans(self):
+        """ Preemption plan of every TL on the route, tl_plans holds plans of the next occurrence of each TL. """
+        self.route_tl_plans = {}
+        self.route_tl_stop_indexes = {}
+        for tl_index, tl_id in self.route_tls.iteritems():
+            for i in range(tl_index, len(self.remaining_edges)):
+                if self.rtc_conn.topology.get_incoming_lanes(tl_id, self.remaining_edges[i]):
+                    out_edge_id = self.remaining_edges[i + 1] if i + 1 < len(self.remaining_edges) else None
+                    try:
+                        self.route_tl_plans[tl_index] = PreemptionPlan.get(self.rtc_conn.topology,
+                                                                           self.rtc_conn.get_default_tl_program(tl_id),
+                                                                           tl_id, self.remaining_edges[i], out_edge_id)
+                    except Exception:
+                        print "Failed preemption plan. TL: {}, route: {}".format(str(tl_id), str(self.route_name))
+                    # TL stop line is at the start of the edge after incoming edge
+                    self.route_tl_stop_indexes[tl_index] = i + 1
+                    break
+        self.tl_plans = {}
+        self.tl_stop_indexes = {}
+        for tl_index in sorted(self.route_tl_stop_indexes.keys(), reverse=True):
+            if tl_index in self.route_tl_plans:
+                self.tl_plans[self.route_tls[tl_index]] = self.route_tl_plans[tl_index]
+            self.tl_stop_indexes[self.route_tls[tl_index]] = self.route_tl_stop_indexes[tl_index]
+
+    def _get_plan(self, tl_id):
+        if tl_id not in self.tl_plans:
+            raise ValueError("TL {} is not on the route.".format(tl_id))
+        return self.tl_plans[tl_id]
+
+    def calc_route_stats(self):
+        time = self.route_geometry.times[-1] * RouteGeometry.speed_factor
+        length = self.route_geometry.get_total_length()
         print "Route {}; time: {}s, length: {}m, average speed: {}km/h".format(self.route_name, time, length, (length/time)*3.6)
 
     def post_insert_processing(self, step):
@@ -75,30 +136,46 @@ class InterventionVehicle:
     def simulation_step_none_preemption(self, time_step):
         edge_id = self.traci_conn.vehicle.getRoadID(self.id)
         if edge_id:
-            try:
-                self.current_edge_index += self.remaining_edges[self.current_edge_index:].index(edge_id)
-                passed_tls = filter(lambda x: x < self.current_edge_index, sorted(self.route_tls.keys()))
-                for tl_index in passed_tls:
+            if self._advance_on_route(edge_id):
+                for tl_index in self.route_cursor.pop_passed_tls():
                     self.stats.add_visited_intersection(self.route_tls[tl_index], time_step)
-                    del self.route_tls[tl_index]
-            except ValueError:
-                if GeneralSettings.debug_print:
-                    print('Current edge is not in remaining edges.')
+                    self._pass_tl(tl_index)
 
     def simulation_step(self, time_step):
         edge_id = self.traci_conn.vehicle.getRoadID(self.id)
         if edge_id:
-            try:
-                self.current_edge_index += self.remaining_edges[self.current_edge_index:].index(edge_id)
-                passed_tls = filter(lambda x: x < self.current_edge_index, sorted(self.route_tls.keys()))
-                for tl_index in passed_tls:
-                    self.rtc_conn.request_reset_tl_state(self.id, time_step + 3, self.reset_mode,
-                                                    self.route_tls[tl_index])
-                    self.stats.add_visited_intersection(self.route_tls[tl_index], time_step)
-                    del self.route_tls[tl_index]
-            except ValueError:
-                if GeneralSettings.debug_print:
-                    print('Current edge is not in remaining edges.')
+            if self._advance_on_route(edge_id):
+                self.route_position = self.route_geometry.get_position(
+                    self.current_edge_index, self.traci_conn.vehicle.getLanePosition(self.id))
+                for tl_index in self.route_cursor.pop_passed_tls():
+                    tl_id = self.route_tls[tl_index]
+                    try:
+                        self.rtc_conn.request_reset_tl_state(self.id, time_step + 3, self.reset_mode, tl_id)
+                    except ValueError as e:
+                        if GeneralSettings.debug_print:
+                            print(str(e))
+                    self.stats.add_visited_intersection(tl_id, time_step)
+                    self._pass_tl(tl_index)
+            else:
+                # Vehicle is inside junction at the end of the current edge
+                self.route_position = self.route_geometry.get_position(self.current_edge_index)
+
+    def _advance_on_route(self, edge_id):
+        if self.route_cursor.advance(edge_id):
+            self.current_edge_index = self.route_cursor.current_edge_index
+            return True
+        if GeneralSettings.debug_print:
+            print('Current edge is not in remaining edges.')
+        return False
+
+    def _pass_tl(self, tl_index):
+        """ Remove passed TL and switch its plan to the next occurrence of the same TL on the route (if any). """
+        tl_id = self.route_tls.pop(tl_index)
+        next_tl_index = self.route_cursor.get_next_tl_occurrence(tl_index)
+        if next_tl_index in self.route_tl_plans:
+            self.tl_plans[tl_id] = self.route_tl_plans[next_tl_index]
+        if next_tl_index in self.route_tl_stop_indexes:
+            self.tl_stop_indexes[tl_id] = self.route_tl_stop_indexes[next_tl_index]
 
     # <editor-fold desc="Preemption">
 
@@ -143,17 +220,10 @@ class InterventionVehicle:
 
     def _immediate_preempt_next_tl(self, tl_id, tl_lane_index, distance, time_step):
         # Prepare new traffic lights state
-        vehicle_lane_id, _ = self._find_tl_incoming_outgoing_lanes_for_iv(tl_id)
-        tl_controlled_lanes = self.traci_conn.trafficlight.getControlledLanes(tl_id)
-        indices = [i for i, x in enumerate(tl_controlled_lanes) if x.startswith(vehicle_lane_id[:-4])]
-
-        if indices:
-            new_state = list('r' * len(tl_controlled_lanes))
-            for i in indices:
-                new_state[i] = 'G'
-            new_state = "".join(new_state)
-        else:
-            new_state = ('r' * tl_lane_index) + 'G' + ('r' * (len(tl_controlled_lanes) - 1 - tl_lane_index))
+        new_state = self._get_plan(tl_id).immediate_state
+        if new_state is None:
+            controlled_lanes_count = len(self.rtc_conn.topology.controlled_lanes[tl_id])
+            new_state = ('r' * tl_lane_index) + 'G' + ('r' * (controlled_lanes_count - 1 - tl_lane_index))
 
         # Send preemption request
         checkpoint_log = "Preempting TL with id: {} in distance of {} meters.".format(tl_id, int(distance))
@@ -203,34 +273,18 @@ class InterventionVehicle:
                     self._immediate_preempt_next_tl_with_minimal_blockage(tl_id, dist_to_tl, time_step)
 
     def _get_target_phase(self, tl_id):
-        in_lanes, out_lane = self._get_tl_incoming_outgoing_lanes_for_iv(tl_id)
-
-        tl_controlled_lanes = self.traci_conn.trafficlight.getControlledLanes(tl_id)
-        indices = [i for i, x in enumerate(tl_controlled_lanes) if x in in_lanes]
-
-        # Find state where 'g' for indices
-        phases = self.rtc_conn.get_default_tl_state(tl_id)._phases
-        for i, phase in enumerate(phases):
-            if phase._phaseDef[indices[0]:(indices[-1] + 1)].lower() == ('g' * len(indices)):
-                break
-        return i, self.traci_conn.trafficlight.getPhase(tl_id)
+        return self._get_plan(tl_id).target_phase_index, self.traci_conn.trafficlight.getPhase(tl_id)
 
     def _perform_mediate_preemption(self, time_step, tl_id, dist_to_tl):
-        target_phase, target_phase_index, tl_def = self._get_tl_data(tl_id)
-        phases = tl_def._phases
+        target_phase_index, tl_program = self._get_tl_data(tl_id)
         curr_phase_index = self.traci_conn.trafficlight.getPhase(tl_id)
         eta = self._get_estimation_for_tl(tl_id, dist_to_tl)
         if curr_phase_index == target_phase_index and eta < 30:
-            phases[target_phase_index]._duration = (eta + 15) * 1000
-            phases[target_phase_index]._phaseDef = self._get_new_tl_phase(tl_id)
+            tl_def = tl_program.build_logic(durations={target_phase_index: (eta + 15) * 1000},
+                                            states={target_phase_index: self._get_new_tl_phase(tl_id)})
             self._set_tl_new_definition(dist_to_tl, time_step, tl_def, tl_id)
         else:
-            if curr_phase_index >= target_phase_index:
-                pending_phases = phases[curr_phase_index:] + phases[:target_phase_index]
-            else:
-                pending_phases = phases[curr_phase_index:target_phase_index]
-
-            needed_time = sum([phase._duration for phase in pending_phases]) / 1000
+            needed_time = tl_program.time_to_phase(curr_phase_index, target_phase_index) / 1000
 
             if not eta:
                 if GeneralSettings.debug_print:
@@ -238,7 +292,7 @@ class InterventionVehicle:
                     return
             delta = eta / needed_time
             if delta > 2:
-                phases_duration = sum([phase._duration for phase in phases]) / 1000
+                phases_duration = tl_program.cycle_duration / 1000
                 if abs(eta - (phases_duration + needed_time)) > phases_duration / 2:
                     if GeneralSettings.debug_print:
                         print(
@@ -253,13 +307,16 @@ class InterventionVehicle:
                     print('Cannot mediate preempt TL: {} for vehicle: {}, eta: {}, needed_time: {}.'.format(
                         tl_id, self.id, eta, needed_time))
             else:
-                for phase in pending_phases:
-                    if 'g' in phase._phaseDef.lower():
-                        phase._duration = max(min(phase._duration * delta, 40000), 5000)
+                durations = {}
+                for index in tl_program.pending_phase_indexes(curr_phase_index, target_phase_index):
+                    duration = tl_program.durations[index]
+                    if 'g' in tl_program.phase_states[index].lower():
+                        durations[index] = max(min(duration * delta, 40000), 5000)
                     else:
-                        phase._duration = max(min(phase._duration * delta, 5000), 3000)
-                phases[target_phase_index]._phaseDef = self._get_new_tl_phase(tl_id)
-                phases[target_phase_index]._duration = 60 * 1000
+                        durations[index] = max(min(duration * delta, 5000), 3000)
+                durations[target_phase_index] = 60 * 1000
+                tl_def = tl_program.build_logic(durations=durations,
+                                                states={target_phase_index: self._get_new_tl_phase(tl_id)})
                 self._set_tl_new_definition(dist_to_tl, time_step, tl_def, tl_id)
 
     def _set_tl_new_definition(self, distance_to_tl, time_step, tl_def, tl_id):
@@ -269,173 +326,31 @@ class InterventionVehicle:
         self.rtc_conn.request_preemption(request)
 
     def _get_tl_data(self, tl_id):
-        in_lane, _ = self._find_tl_incoming_outgoing_lanes_for_iv(tl_id)
-        tl_controlled_lanes = self.traci_conn.trafficlight.getControlledLanes(tl_id)
-        indices = [i for i, x in enumerate(tl_controlled_lanes) if x == in_lane]
-        tl_def = self.rtc_conn.get_default_tl_state(tl_id)
-        phases = tl_def._phases
-        for index, phase in enumerate(phases):
-            if phase._phaseDef[indices[0]:(indices[-1] + 1)].lower() == ('g' * len(indices)):
-                return list(phase._phaseDef), index, tl_def
-        raise ValueError("Target phase was not found.")
+        target_phase_index = self._get_plan(tl_id).mediate_phase_index
+        if target_phase_index is None:
+            raise ValueError("Target phase was not found.")
+        return target_phase_index, self.rtc_conn.get_default_tl_program(tl_id)
 
     def _get_estimation_for_tl(self, tl_id, tl_distance):
-        _, out_lane = self._find_tl_incoming_outgoing_lanes_for_iv(tl_id)
-        out_edge = self.traci_conn.lane.getEdgeID(out_lane)
-        dist = 0
-        eta = 0
-        try:
-            out_edge_index = self.remaining_edges.index(out_edge)
-        except ValueError:
-            out_edge_index = len(self.remaining_edges) - 1
-
-        for edge_id in self.remaining_edges[self.current_edge_index:out_edge_index]:
-            if edge_id == out_edge or dist > tl_distance:
-                return eta
-            try:
-                allowed_speed = RoadMapData.road_map.getEdge(edge_id).getSpeed()
-                length = RoadMapData.road_map.getEdge(edge_id).getLength()
-                if edge_id == self.traci_conn.vehicle.getRoadID(self.id):
-                    edge_dist = length - self.traci_conn.vehicle.getLanePosition(self.id)
-                    dist += edge_dist
-                    eta += edge_dist / (1.1 * allowed_speed)
-                else:
-                    dist += length
-                    eta += length / (1.1 * allowed_speed)
-            except KeyError, e:
-                if GeneralSettings.debug_print:
-                    print("KeyError while _get_estimation_for_tl: " + e)
+        """ Free-flow ETA to the TL stop line. """
+        stop_index = self.tl_stop_indexes.get(tl_id)
+        if stop_index is None:
+            return None
+        eta = self.route_geometry.get_travel_time(stop_index, self.current_edge_index, self.route_position)
         return eta if eta > 0 else None
 
     def get_distance_to_tl(self, tl_id):
-        _, out_lane = self._find_tl_incoming_outgoing_lanes_for_iv(tl_id)
-        out_edge = self.traci_conn.lane.getEdgeID(out_lane)
-        dist = 0
-        try:
-            out_edge_index = self.remaining_edges.index(out_edge)
-        except ValueError:
-            out_edge_index = len(self.remaining_edges) - 1
-
-        for edge_id in self.remaining_edges[self.current_edge_index:out_edge_index]:
-            if edge_id == out_edge:
-                return dist
-            try:
-                length = RoadMapData.road_map.getEdge(edge_id).getLength()
-                if edge_id == self.traci_conn.vehicle.getRoadID(self.id):
-                    edge_dist = length - self.traci_conn.vehicle.getLanePosition(self.id)
-                    dist += edge_dist
-                else:
-                    dist += length
-            except KeyError, e:
-                if GeneralSettings.debug_print:
-                    print("KeyError while get_distance_to_tl: " + e)
+        stop_index = self.tl_stop_indexes.get(tl_id)
+        if stop_index is None:
+            return None
+        dist = self.route_geometry.get_distance(stop_index, self.route_position)
         return dist if dist > 0 else None
 
     def _get_new_tl_phase(self, tl_id):
-        in_lanes, out_lane = self._get_tl_incoming_outgoing_lanes_for_iv(tl_id)
-
-        tl_controlled_lanes = self.traci_conn.trafficlight.getControlledLanes(tl_id)
-        indices = [i for i, x in enumerate(tl_controlled_lanes) if x in in_lanes]
-        controlled_lanes_indexes = self._get_controlled_lanes_indexes(tl_controlled_lanes, in_lanes)
-
-        # Find state where 'g' for indices
-        phases = self.rtc_conn.get_default_tl_state(tl_id)._phases
-        new_phase = None
-        for phase in phases:
-            if phase._phaseDef[indices[0]:(indices[-1] + 1)].lower() == ('g' * len(indices)):
-                new_phase = list(phase._phaseDef)
-                break
-
-        if new_phase:
-            in_lane = in_lanes[0]
-            controlled_links = self.traci_conn.trafficlight.getControlledLinks(tl_id)
-            out_lane = out_lane[1:] if out_lane.startswith('-') else '-' + out_lane
-            # Modify state to prevent crossing IV path
-            for i, signal in enumerate(new_phase):
-                if i not in indices and signal.lower() == 'g':
-                    cl = controlled_links[i][0]
-                    cl_in_lane = cl[0]
-                    cl_out_lane = cl[1][1:] if cl[1].startswith('-') else '-' + cl[1]
-                    if out_lane == cl_out_lane:
-                        new_phase[i] = 'r'
-                    elif out_lane == cl_in_lane:
-                        try:
-                            if cl_out_lane not in in_lanes and controlled_lanes_indexes[cl_out_lane] >= \
-                                    controlled_lanes_indexes[cl_in_lane]:
-                                new_phase[i] = 'r'
-                        except KeyError:
-                            new_phase[i] = 'r'
-                    else:
-                        try:
-                            if controlled_lanes_indexes[cl_in_lane] > controlled_lanes_indexes[out_lane] > \
-                                    controlled_lanes_indexes[cl_out_lane] >= controlled_lanes_indexes[in_lane]:
-                                new_phase[i] = 'r'
-                            elif controlled_lanes_indexes[cl_in_lane] < controlled_lanes_indexes[out_lane] < \
-                                    controlled_lanes_indexes[cl_out_lane] < max(controlled_lanes_indexes.values()):
-                                new_phase[i] = 'r'
-                        except KeyError:
-                            new_phase[i] = 'r'
-            return "".join(new_phase)
-        else:
+        new_phase = self._get_plan(tl_id).minimal_blockage_state
+        if new_phase is None:
             raise ValueError("New target phase was not found.")
-
-    def _find_tl_incoming_outgoing_lanes_for_iv(self, tl_id):
-        controlled_lanes = set(self.traci_conn.trafficlight.getControlledLanes(tl_id))
-        for i, edge in enumerate(self.remaining_edges):
-            for lane in controlled_lanes:
-                if lane.startswith(edge):
-                    if i + 1 < len(self.remaining_edges):
-                        return lane, self._find_controlled_line_for_edge(tl_id, self.remaining_edges[i + 1])
-                    else:
-                        return lane, self._find_next_lane(lane)
-        return None, None
-
-    def _find_controlled_line_for_edge(self, tl_id, edge):
-        out_lines = set([link[0][1] for link in self.traci_conn.trafficlight.getControlledLinks(tl_id)])
-        for lane in out_lines:
-            if lane.startswith(edge):
-                return lane
-        return None
-
-    def _find_next_lane(self, lane):
-        edge = RoadMapData.road_map.getEdge(self.traci_conn.lane.getEdgeID(lane))
-        return edge.getOutgoing().values()[0][0].getToLane().getID()
-
-    """
-    Calculate incoming and outgoing lanes for specified TL
-    """
-
-    def _get_tl_incoming_outgoing_lanes_for_iv(self, tl_id):
-        controlled_lanes = set(self.traci_conn.trafficlight.getControlledLanes(tl_id))
-        for i, edge in enumerate(self.remaining_edges[self.current_edge_index:]):
-            for lane in controlled_lanes:
-                if lane.startswith(edge):
-                    in_lanes = [lane for lane in controlled_lanes if lane.startswith(edge)]
-                    if self.current_edge_index + i + 1 < len(self.remaining_edges):
-                        next_edge = self.remaining_edges[self.current_edge_index + i + 1]
-                        return in_lanes, self._find_controlled_line_for_edge(tl_id, next_edge)
-                    else:
-                        return in_lanes, self._find_next_lane(in_lanes[0])
-        return None, None
-
-    def _get_controlled_line_for_edge(self, tl_id, edge):
-        out_lines = set([link[0][1] for link in self.traci_conn.trafficlight.getControlledLinks(tl_id)])
-        return [lane for lane in out_lines if lane.startswith(edge)]
-
-    @staticmethod
-    def _get_controlled_lanes_indexes(controlled_lanes, in_lanes):
-        # Prepare dictionary -> lane: index
-        indexes = {lane: controlled_lanes.index(lane) for lane in set(controlled_lanes)}
-
-        # Normalize dictionary, that in_line has index 0
-        counts = collections.Counter(numpy.array(controlled_lanes))
-        lanes_count = len(controlled_lanes)
-
-        while min([indexes[in_lane] for in_lane in in_lanes]) != 0:
-            key_of_max_index_value = max(indexes.iteritems(), key=operator.itemgetter(1))[0]
-            for lane in indexes.keys():
-                indexes[lane] = (indexes[lane] + counts[key_of_max_index_value]) % lanes_count
-        return indexes
+        return new_phase
 
     def _initial_mediate_preempt(self, time_step):
         for tl_id in self.route_tls.values():
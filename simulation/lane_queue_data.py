@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class LaneQueueData(object):
+    """
+    Queue lengths [m] of a set of lanes as time steps x lanes matrix. Rows grow with amortized doubling,
+    lanes can be added later (e.g. when a vehicle gets a return route over other TLs).
+    """
+    __slots__ = ('lane_ids', 'lane_indexes', 'data', 'num_of_steps')
+
+    def __init__(self, lane_ids=(), capacity=1024):
+        self.lane_ids = []
+        self.lane_indexes = {}
+        self.data = np.zeros((capacity, 0), dtype=np.float32)
+        self.num_of_steps = 0
+        self.add_lanes(lane_ids)
+
+    def add_lanes(self, lane_ids):
+        new_lanes = []
+        for lane_id in lane_ids:
+            if lane_id not in self.lane_indexes:
+                self.lane_indexes[lane_id] = len(self.lane_ids)
+                self.lane_ids.append(lane_id)
+                new_lanes.append(lane_id)
+        if new_lanes:
+            self.data = np.hstack((self.data, np.zeros((self.data.shape[0], len(new_lanes)), dtype=np.float32)))
+        return new_lanes
+
+    def add_row(self):
+        """ Adds zero row for the next time step and returns it for in place writes. """
+        if self.num_of_steps == self.data.shape[0]:
+            data = np.zeros((max(2 * self.data.shape[0], 1), self.data.shape[1]), dtype=np.float32)
+            data[:self.num_of_steps] = self.data[:self.num_of_steps]
+            self.data = data
+        row = self.data[self.num_of_steps]
+        row[:] = 0
+        self.num_of_steps += 1
+        return row
+
+    def append_row(self, values):
+        """ Values are ordered as lane ids. """
+        self.add_row()[:] = values
+
+    def view(self):
+        return self.data[:self.num_of_steps]
+
+    def get_lanes(self, lane_ids):
+        """ Returns time steps x lanes matrix of the given lanes, lanes without data are zero. """
+        result = np.zeros((self.num_of_steps, len(lane_ids)), dtype=np.float32)
+        for i, lane_id in enumerate(lane_ids):
+            index = self.lane_indexes.get(lane_id)
+            if index is not None:
+                result[:, i] = self.data[:self.num_of_steps, index]
+        return result
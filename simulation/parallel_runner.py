@@ -1,19 +1,22 @@
 #!/usr/bin/env python
 import os
 import sys
-import randomTrips
 import multiprocessing as mp
 import json
 import time
 import random
-import copy
-from sumolib import net
+import traceback
+import Queue
 from functools import partial
 from multiprocessing import Process
 from optparse import OptionParser
 from settings import GeneralSettings, TripSettings
 from simulation_runner import SimulationRunner
 from csv_exporter import CsvExporter
+from sweep import Sweep
+from adaptive_iterations import AdaptiveIterations
+from trip_cache import TripCache
+from trip_generator import TripGenerator
 
 
 try:
@@ -32,12 +35,22 @@ def get_options():
     opt_parser = OptionParser()
     opt_parser.add_option("-C", "--config", action="store", type="string", dest="config_file",
                           default="../data_set/trnovo/config-parallel.json")
+    opt_parser.add_option("--skip-plots", action="store_true", default=False,
+                          help="do not render plots after simulations, they can be rendered later by plot_pipeline.py")
+    opt_parser.add_option("-w", "--workers", action="store", type="int", dest="workers", default=None,
+                          help="number of simulation worker processes, number of CPUs by default")
+    opt_parser.add_option("--resume", action="store_true", default=False,
+                          help="run only sweep cells which are not recorded as completed, keep existing outputs")
+    opt_parser.add_option("--listen", action="store", type="string", dest="listen", default=None,
+                          help="serve jobs to sweep_worker.py processes on <host:port> instead of running them locally")
+    opt_parser.add_option("--local-workers", action="store", type="int", dest="local_workers", default=0,
+                          help="number of sweep workers started on this machine with --listen")
     opt_parser_options, _ = opt_parser.parse_args()
     return opt_parser_options
 
 
 def parse_trip_opts(map_file_name, route_file_name, trips_file_name, edge_lengths_per_vehicle_type, vehicle, options,
-                    trip_settings):
+                    trip_settings, seed=None):
     """
         Return an option list for randomTrips.py for a given vehicle
     """
@@ -61,96 +74,346 @@ def parse_trip_opts(map_file_name, route_file_name, trips_file_name, edge_length
             "-o", trips_file_name,
             "-e", float(trip_settings.end)]
     opts += vehicle_parameters[vehicle]
+    if trip_settings.length:
+        opts += ["--length"]
+    if seed is not None:
+        opts += ["--seed", seed]
     return opts
 
 
-def prepare_trips(base_dir, road_map_file_path, edge_lengths_per_vehicle_type, trip_settings):
-    data = {u'vehicles': {u'passenger': {u'count': trip_settings.passenger_count, u'fringeFactor': 5},
-                          u'motorcycle': {u'count': trip_settings.motorcycle_count, u'fringeFactor': 2},
-                          u'bus': {u'count': trip_settings.bus_count, u'fringeFactor': 2},
-                          u'taxi': {u'count': trip_settings.taxi_count, u'fringeFactor': 2}}}
+def get_vehicle_trip_options(trip_settings):
+    return {u'passenger': {u'count': trip_settings.passenger_count, u'fringeFactor': 5},
+            u'motorcycle': {u'count': trip_settings.motorcycle_count, u'fringeFactor': 2},
+            u'bus': {u'count': trip_settings.bus_count, u'fringeFactor': 2},
+            u'taxi': {u'count': trip_settings.taxi_count, u'fringeFactor': 2}}
 
-    for vehicle, vehicle_options in data["vehicles"].items():
-        route_file_name = '{}/{}.rou.xml'.format(base_dir, vehicle)
-        trips_file_name = '{}/{}.trips.xml'.format(base_dir, vehicle)
 
-        try:
-            vehicle_options = parse_trip_opts(road_map_file_path, route_file_name, trips_file_name,
-                                              edge_lengths_per_vehicle_type, vehicle, vehicle_options, trip_settings)
-        except ZeroDivisionError:
-            continue
+def generate_trips(task):
+    """ Generates trips and routes of a single vehicle class and seed into a cache entry in a pool worker. """
+    # randomTrips is found in SUMO tools, which are added to the path above
+    import randomTrips
+    entry_dir, vehicle, opts_args = task
+    tmp_dir = TripCache.get_tmp_dir(entry_dir)
+    route_file_name = '{}/{}.rou.xml'.format(tmp_dir, vehicle)
+    trips_file_name = '{}/{}.trips.xml'.format(tmp_dir, vehicle)
+    randomTrips.main(randomTrips.get_options(parse_trip_opts(route_file_name=route_file_name,
+                                                             trips_file_name=trips_file_name, **opts_args)))
+    TripCache.commit(tmp_dir, entry_dir)
+    return entry_dir
+
+
+trip_generators = {}
 
-        randomTrips.main(randomTrips.get_options(vehicle_options))
 
+def get_trip_generator(road_map_file_path):
+    """ Trip generator of the road map, which is read once per process and shared with simulations. """
+    road_map = SimulationRunner.get_road_map(road_map_file_path)
+    if road_map_file_path not in trip_generators or trip_generators[road_map_file_path].network is not road_map:
+        trip_generators.clear()
+        trip_generators[road_map_file_path] = TripGenerator(road_map)
+    return trip_generators[road_map_file_path]
 
-def get_edge_lengths(road_map_file_path):
-    edges = net.readNet(road_map_file_path).getEdges()
-    lengths = {}
-    for vehicle in [u'passenger', u'motorcycle', u'bus', u'taxi']:
-        length = 0.
-        for edge in edges:
-            if edge.allows(vehicle):
-                length += edge.getLaneNumber() * edge.getLength()
-        lengths[vehicle] = length
-    return lengths
+
+def prepare_trips(trip_cache, road_map_file_path, trip_settings, seeds, num_of_workers):
+    """
+    Generates trips of all vehicle classes and seeds which are not cached yet. Internal generator reuses
+    the network loaded once per process, randomTrips.py runs in a pool of workers. Returns route files per seed.
+    """
+    trip_generator = None
+    edge_lengths_per_vehicle_type = None
+    seed_route_files = {}
+    tasks = []
+    num_of_cached = 0
+    for seed in seeds:
+        seed_route_files[seed] = []
+        for vehicle, vehicle_options in get_vehicle_trip_options(trip_settings).items():
+            if vehicle_options['count'] <= 0:
+                continue
+            entry_dir = trip_cache.get_entry_dir(trip_settings.generator, vehicle, vehicle_options['count'],
+                                                 vehicle_options['fringeFactor'], seed, trip_settings.end,
+                                                 trip_settings.length)
+            if TripCache.is_cached(entry_dir):
+                seed_route_files[seed].append(TripCache.get_route_file(entry_dir, vehicle))
+                num_of_cached += 1
+                continue
+            if trip_generator is None:
+                trip_generator = get_trip_generator(road_map_file_path)
+                edge_lengths_per_vehicle_type = trip_generator.get_edge_lengths()
+            if edge_lengths_per_vehicle_type[vehicle] <= 0:
+                continue
+            seed_route_files[seed].append(TripCache.get_route_file(entry_dir, vehicle))
+            tasks.append((entry_dir, vehicle, {'map_file_name': road_map_file_path,
+                                               'edge_lengths_per_vehicle_type': edge_lengths_per_vehicle_type,
+                                               'vehicle': vehicle, 'options': vehicle_options,
+                                               'trip_settings': trip_settings, 'seed': seed}))
+
+    print "Trips of {} seeds: {} cached, {} to generate".format(len(seeds), num_of_cached, len(tasks))
+    if not tasks:
+        return seed_route_files
+    if trip_settings.generator == 'internal':
+        for entry_dir, vehicle, opts_args in tasks:
+            tmp_dir = TripCache.get_tmp_dir(entry_dir)
+            trip_generator.write_trips(TripCache.get_route_file(tmp_dir, vehicle), vehicle,
+                                       opts_args['options']['count'], opts_args['options']['fringeFactor'],
+                                       trip_settings.end, opts_args['seed'], edge_lengths_per_vehicle_type[vehicle],
+                                       trip_settings.length)
+            TripCache.commit(tmp_dir, entry_dir)
+    else:
+        pool = mp.Pool(min(num_of_workers, len(tasks)))
+        try:
+            pool.map(generate_trips, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    return seed_route_files
 
 
 def processor(json_data, lock, vehicle_mode):
         SimulationRunner(json_data, True, vehicle_mode).run_parallel(lock)
 
 
+# <editor-fold desc="Worker pool">
+
+worker_lock = None
+
+
+def init_worker(lock):
+    # Lock is shared by all pool workers, it can not be passed with jobs
+    global worker_lock
+    worker_lock = lock
+    # Worker processes exit without atexit handlers, pooled SUMO instances are closed by multiprocessing finalizer
+    from multiprocessing.util import Finalize
+    from sumo_connection_pool import SumoConnectionPool
+    Finalize(None, SumoConnectionPool.close_all, exitpriority=10)
+
+
+def run_job(job):
+    """ Runs a single sweep cell simulation in a pool worker, returns its route duration if it succeeds. """
+    job_name, config, vehicle_mode = job
+    start = time.time()
+    runner = None
+    try:
+        runner = SimulationRunner(config, True, vehicle_mode, run_label=job_name)
+        runner.run_parallel(worker_lock)
+        return job_name, time.time() - start, None, runner.get_route_duration()
+    except Exception, e:
+        traceback.print_exc()
+        if runner is not None:
+            # SUMO instance of a failed job is not reused, it can be in any state
+            try:
+                runner.conn.close()
+            except Exception:
+                pass
+        return job_name, time.time() - start, str(e), None
+
+
+def get_jobs(sweep, cells, seed_route_files):
+    """ Returns jobs of sweep cells and map of job name to its cell. """
+    jobs = []
+    job_cells = {}
+    for cell in cells:
+        job_name = Sweep.get_cell_label(cell)
+        jobs.append((job_name, sweep.get_cell_config(cell, seed_route_files[cell['seed']]), None))
+        job_cells[job_name] = cell
+    return jobs, job_cells
+
+
+def report_progress(done, num_of_jobs, job_name, job_time, error, start):
+    elapsed = time.time() - start
+    eta = elapsed / done * (num_of_jobs - done)
+    print("[{}/{}] Job {} {} in {:.0f} s. Elapsed: {:.0f} s, ETA: {:.0f} s.".format(
+        done, num_of_jobs, job_name, 'failed' if error is not None else 'finished', job_time, elapsed, eta))
+    sys.stdout.flush()
+
+
+def run_jobs(jobs, num_of_workers, on_finished=None):
+    """
+    Persistent pool of workers pulls jobs one by one, progress and ETA are printed as jobs finish.
+    on_finished is called with the name and route duration of every successfully finished job.
+    """
+    pool = mp.Pool(num_of_workers, init_worker, (mp.Lock(),))
+    start = time.time()
+    failed = []
+    try:
+        for done, (job_name, job_time, error, route_duration) in enumerate(pool.imap_unordered(run_job, jobs), 1):
+            if error is not None:
+                failed.append(job_name)
+            elif on_finished is not None:
+                on_finished(job_name, route_duration)
+            report_progress(done, len(jobs), job_name, job_time, error, start)
+    finally:
+        pool.close()
+        pool.join()
+    if failed:
+        print("Failed jobs: {}".format(", ".join(failed)))
+    return failed
+
+
+def run_adaptive_jobs(sweep, trip_cache, road_map_file_path, trip_settings, num_of_workers):
+    """
+    Runs iterations of adaptive sweep cells in a persistent pool of workers. Next iteration of a cell is
+    submitted when its previous iteration finishes, until the cell converges. Trips are generated once per seed.
+    """
+    iterations = AdaptiveIterations(sweep)
+    pool = mp.Pool(num_of_workers, init_worker, (mp.Lock(),))
+    results = Queue.Queue()
+    seed_route_files = {}
+    job_cells = {}
+    failed = []
+    start = time.time()
+
+    def submit(cell):
+        if cell['seed'] not in seed_route_files:
+            seed_route_files.update(prepare_trips(trip_cache, road_map_file_path, trip_settings, [cell['seed']],
+                                                  num_of_workers))
+        job_name = Sweep.get_cell_label(cell)
+        job_cells[job_name] = cell
+        pool.apply_async(run_job, ((job_name, sweep.get_cell_config(cell, seed_route_files[cell['seed']]), None),),
+                         callback=results.put)
+
+    num_of_running = 0
+    for cell in iterations.get_initial_cells():
+        submit(cell)
+        num_of_running += 1
+    done = 0
+    try:
+        while num_of_running:
+            # Timeout keeps the main thread responsive to keyboard interrupt
+            try:
+                job_name, job_time, error, route_duration = results.get(timeout=1)
+            except Queue.Empty:
+                continue
+            num_of_running -= 1
+            done += 1
+            cell = job_cells.pop(job_name)
+            if error is not None:
+                failed.append(job_name)
+            else:
+                sweep.mark_completed(cell, route_duration)
+            for next_cell in iterations.add_result(cell, route_duration if error is None else None):
+                submit(next_cell)
+                num_of_running += 1
+            report_progress(done, done + num_of_running + iterations.get_num_of_remaining(), job_name, job_time,
+                            error, start)
+    finally:
+        pool.close()
+        pool.join()
+    iterations.print_summary()
+    if failed:
+        print("Failed jobs: {}".format(", ".join(failed)))
+    return failed
+
+
+def run_distributed(sweep, cells, results_dir, address, num_of_local_workers):
+    """
+    Serves jobs to sweep workers over TCP, workers generate trips and send back results store shards.
+    Local workers connect to the coordinator from this machine, e.g. to test the setup.
+    Iterations of adaptive sweep are added to the coordinator as previous iterations finish.
+    """
+    from sweep_coordinator import SweepCoordinator
+    from sweep_worker import work
+    iterations = AdaptiveIterations(sweep) if sweep.adaptive is not None else None
+    if iterations is not None:
+        cells = iterations.get_initial_cells()
+    job_cells = {Sweep.get_cell_label(cell): cell for cell in cells}
+    jobs = [(Sweep.get_cell_label(cell), sweep.get_cell_config(cell), cell['seed']) for cell in cells]
+    start = time.time()
+    num_of_done = [0]
+
+    def on_finished(job_name, job_time, error, route_duration):
+        num_of_done[0] += 1
+        cell = job_cells[job_name]
+        if error is None:
+            sweep.mark_completed(cell, route_duration)
+        num_of_jobs = len(coordinator.jobs)
+        if iterations is not None:
+            for next_cell in iterations.add_result(cell, route_duration if error is None else None):
+                next_job_name = Sweep.get_cell_label(next_cell)
+                job_cells[next_job_name] = next_cell
+                coordinator.add_job((next_job_name, sweep.get_cell_config(next_cell), next_cell['seed']))
+            num_of_jobs = len(coordinator.jobs) + iterations.get_num_of_remaining()
+        report_progress(num_of_done[0], num_of_jobs, job_name, job_time, error, start)
+
+    # Local workers are started before the server socket is open, they retry to connect
+    local_workers = [mp.Process(target=work, args=(('localhost', address[1]),))
+                     for _ in range(0, num_of_local_workers)]
+    [p.start() for p in local_workers]
+    coordinator = SweepCoordinator(jobs, results_dir, on_finished)
+    failed = coordinator.serve(address)
+    [p.join() for p in local_workers]
+    if iterations is not None:
+        iterations.print_summary()
+    if failed:
+        print("Failed jobs: {}".format(", ".join(failed.keys())))
+    return failed
+
+# </editor-fold>
+
+
 def run_async():
     options = get_options()
     with open(options.config_file) as json_file:
         json_data = json.load(json_file)
 
-        # Clear output and statistics
+    base_dir = json_data['general']['base_dir']
+    road_map_file_path = json_data['map']['map_location']
+    trip_settings = TripSettings(json_data['random_trips'])
+    plot_data_dir = GeneralSettings.get_plot_data_dir(json_data['general'])
+    sweep = Sweep(json_data, '{}/sweep_completed.jsonl'.format(base_dir))
+
+    if not options.resume:
+        # Clear output, statistics and record of completed cells
         GeneralSettings.clear_output_dir(json_data['general']['statistics_output_dir'])
         GeneralSettings.clear_output_dir(json_data['general']['debug_output_dir'])
+        GeneralSettings.clear_output_dir(plot_data_dir)
+        sweep.clear_completed()
 
-        num_of_iterations = json_data['general']['num_of_iterations']
-        base_dir = json_data['general']['base_dir']
-        road_map_file_path = json_data['map']['map_location']
-        trip_settings = TripSettings(json_data['random_trips'])
-        num_of_modes = len(json_data['vehicle_modes'])
-
-        # Prepare route export files with headers
-        CsvExporter.prepare_route_export_headers(json_data['general']['statistics_output_dir'], json_data['routes'])
-
-    if num_of_iterations < 1:
-        raise ValueError("Number of iterations must be greater than 0")
+        # Prepare route export files with headers, route trips are a table of the results store if it is used
+        if not json_data['general'].get('results_store', False):
+            CsvExporter.prepare_route_export_headers(json_data['general']['statistics_output_dir'],
+                                                     json_data['routes'])
 
-    print "Start of {} iterations".format(num_of_iterations)
+    cells = sweep.get_missing_cells()
+    print "Sweep over {} has {} cells, {} to run".format(", ".join(sweep.axes.keys()), len(sweep.get_cells()),
+                                                          len(cells))
     start = time.time()
 
-    edge_lengths_per_vehicle_type = get_edge_lengths(road_map_file_path)
-
-    for i in range(0, num_of_iterations):
-        # generate routes
-        prepare_trips(base_dir, road_map_file_path, edge_lengths_per_vehicle_type, trip_settings)
-
-        # Prepare JSON configuration object
-        for j in [0.8, 1, 1.2]:
-            t_f_density_config = copy.deepcopy(json_data)
-            t_f_density_config['general']['max_num_vehicles'] *= j
-            for l in range(1, len(t_f_density_config['routes']) + 1):
-                route_config = copy.deepcopy(t_f_density_config)
-                route_id = str(l)
-                route_config['vehicles'][0]['route'] = route_id
-                lock = mp.Lock()
-                func = partial(processor, route_config)
-                processes = [Process(target=func, args=(lock, vehicle_mode)) for vehicle_mode in range(0, num_of_modes)]
-
-                [p.start() for p in processes]
-                [p.join() for p in processes]
-                print("Finished iteration with route {} .".format(route_id))
-            print("Finished iteration with {} percent of traffic flow density.".format(j))
-
-        print("Finished {} iteration.".format(i))
+    results_dir = json_data['general'].get('results_dir', json_data['general']['statistics_output_dir'])
+    if options.listen:
+        if not json_data['general'].get('results_store', False):
+            raise ValueError("Distributed sweep requires results_store, workers send back results store shards")
+        if not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+        print "Serving jobs on {}".format(options.listen)
+        from sweep_coordinator import SweepCoordinator
+        run_distributed(sweep, cells, results_dir, SweepCoordinator.parse_address(options.listen),
+                        options.local_workers)
+    elif sweep.adaptive is not None:
+        num_of_workers = options.workers if options.workers else mp.cpu_count()
+        trip_cache = TripCache('{}/trips'.format(base_dir), road_map_file_path)
+        print "Running adaptive iterations on {} workers".format(num_of_workers)
+        run_adaptive_jobs(sweep, trip_cache, road_map_file_path, trip_settings, num_of_workers)
+    else:
+        # Every seed has own trips, generated before the simulations, so jobs of different seeds can run together
+        num_of_workers = options.workers if options.workers else mp.cpu_count()
+        seeds = sorted(set(cell['seed'] for cell in cells))
+        trip_cache = TripCache('{}/trips'.format(base_dir), road_map_file_path)
+        seed_route_files = prepare_trips(trip_cache, road_map_file_path, trip_settings, seeds, num_of_workers)
+
+        jobs, job_cells = get_jobs(sweep, cells, seed_route_files)
+        print "Running {} jobs on {} workers".format(len(jobs), num_of_workers)
+        run_jobs(jobs, num_of_workers,
+                 lambda job_name, route_duration: sweep.mark_completed(job_cells[job_name], route_duration))
 
     elapsed = time.time() - start
     print "Simulation elapsed seconds count: %02d" % elapsed
 
+    if json_data['general'].get('results_store', False):
+        from results_store import ResultsStore
+        ResultsStore.merge(results_dir)
+    if not options.skip_plots:
+        from plot_pipeline import render_plots
+        render_plots(plot_data_dir)
     SimulationRunner.export_archive(base_dir)
     print "Finished!"
 
@@ -173,13 +436,13 @@ def run_normal():
     if num_of_iterations < 1:
         raise ValueError("Number of iterations must be greater than 0")
 
-    edges = net.readNet(road_map_file_path).getEdges()
+    trip_cache = TripCache('{}/trips'.format(base_dir), road_map_file_path)
 
     print "Start of {} iterations".format(num_of_iterations)
     start = time.time()
     for i in range(0, num_of_iterations):
         # generate routes
-        prepare_trips(base_dir, road_map_file_path, edges, trip_settings)
+        prepare_trips(trip_cache, road_map_file_path, trip_settings, [i], mp.cpu_count())
 
         lock = mp.Lock()
         func = partial(processor, options.config_file)
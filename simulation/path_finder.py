@@ -4,8 +4,8 @@ from alt import Alt
 from a_star import AStar
 from settings import PathFinderAlgorithm, GeneralSettings
 import numpy as np
-import matplotlib.pyplot as plt
 from road_map_data import RoadMapData
+from plot_jobs import PlotJobs
 
 class PathFinder:
     @staticmethod
@@ -58,13 +58,7 @@ class PathFinder:
             visited_data = np.array([node.getCoord() for node in visited])
             path_ = [edge.getFromNode().getCoord() for edge in path]
             path_data = np.array(path_)
-            plt.figure(figsize=(15, 15))
-            plt.title(title)
-            plt.plot(nodes[:, 0], nodes[:, 1], 'bo',
-                     visited_data[:, 0], visited_data[:, 1], 'go',
-                     path_data[:, 0], path_data[:, 1], 'rs')
-            plt.savefig('{}.png'.format(GeneralSettings.debug_output_dir + '/' + title))
-            plt.close('all')
+            PlotJobs.save_route_results(title, nodes, visited_data, path_data)
 
     @staticmethod
     def _print_route_results(start_time, path, visited, vehicle, alg_name):
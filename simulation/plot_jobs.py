@@ -0,0 +1,49 @@
+import os
+import uuid
+import numpy as np
+from settings import GeneralSettings
+
+
+class PlotJobs:
+    """
+    Plot inputs saved during the simulation. Figures are not rendered in the simulation process,
+    plot_pipeline.py renders saved jobs afterwards (and can be skipped or run again).
+    """
+    @staticmethod
+    def save(kind, output_file, **data):
+        directory = GeneralSettings.plot_data_dir
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another worker in the meantime
+                pass
+        np.savez(os.path.join(directory, '{}_{}.npz'.format(kind, uuid.uuid4())),
+                 kind=kind, output_file=os.path.abspath(output_file), **data)
+
+    @staticmethod
+    def save_vehicle_stats(speed, wait_time, allowed_speed, vehicle_id):
+        if GeneralSettings.plot_statistics:
+            PlotJobs.save('vehicle_stats', GeneralSettings.statistics_output_dir + '/vehicle_' + vehicle_id + '.png',
+                          speed=speed, wait_time=wait_time, allowed_speed=allowed_speed, vehicle_id=vehicle_id)
+
+    @staticmethod
+    def save_traffic_lights_per_lane_queues(queue_data, tls_ids, tls_controlled_lanes):
+        if GeneralSettings.plot_statistics:
+            for tl_id in tls_ids:
+                lanes = list(tls_controlled_lanes[tl_id])
+                PlotJobs.save('tl_lane_queues',
+                              GeneralSettings.statistics_output_dir + '/tl_' + tl_id + '_queue_per_lane.png',
+                              tl_id=tl_id, lanes=np.array(lanes), queues=queue_data.get_lanes(lanes))
+
+    @staticmethod
+    def save_route_results(title, nodes, visited, path):
+        if GeneralSettings.debug_plot:
+            PlotJobs.save('route_results', GeneralSettings.debug_output_dir + '/' + title + '.png',
+                          title=title, nodes=nodes, visited=visited, path=path)
+
+    @staticmethod
+    def save_landmarks(nodes, landmarks):
+        if GeneralSettings.debug_plot:
+            PlotJobs.save('landmarks', GeneralSettings.debug_output_dir + '/ALT-landmarks.png',
+                          nodes=nodes, landmarks=landmarks)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Renders plots from plot inputs saved by simulations (PlotJobs) in a process pool.
+It is run after simulations by runner.py and parallel_runner.py unless --skip-plots is set,
+and can be run again on its own: ./plot_pipeline.py -d <plot data dir> [-p <num of processes>]
+Plot input of a job is deleted when its plot is written, failed jobs are kept and rendered again by the next run.
+"""
+import os
+import glob
+import time
+import multiprocessing as mp
+from optparse import OptionParser
+
+
+def get_options():
+    opt_parser = OptionParser()
+    opt_parser.add_option("-d", "--plot-data-dir", action="store", type="string", dest="plot_data_dir",
+                          default="../data_set/trnovo/output/plot_data")
+    opt_parser.add_option("-p", "--processes", action="store", type="int", dest="processes", default=None,
+                          help="number of rendering processes, number of CPUs by default")
+    opt_parser_options, _ = opt_parser.parse_args()
+    return opt_parser_options
+
+
+def render_job(job_file):
+    # matplotlib is imported only in rendering processes
+    from plotter import Plotter
+    try:
+        Plotter.render_job(job_file)
+        os.remove(job_file)
+        return None
+    except Exception, e:
+        return "{}: {}".format(job_file, e)
+
+
+def render_plots(plot_data_dir, processes=None):
+    job_files = sorted(glob.glob(os.path.join(plot_data_dir, '*.npz')))
+    if not job_files:
+        return 0
+    start = time.time()
+    pool = mp.Pool(processes)
+    try:
+        errors = [e for e in pool.map(render_job, job_files) if e is not None]
+    finally:
+        pool.close()
+        pool.join()
+    for error in errors:
+        print("Plot failed - {}".format(error))
+    print("Rendered {} plots in {:.1f} s.".format(len(job_files) - len(errors), time.time() - start))
+    return len(job_files) - len(errors)
+
+
+if __name__ == "__main__":
+    options = get_options()
+    render_plots(options.plot_data_dir, options.processes)
@@ -1,4 +1,7 @@
 import numpy as np
+import matplotlib
+# Figures are only saved to files, non-interactive backend works without display and in worker processes
+matplotlib.use('Agg')
 import matplotlib.patches as mpatches
 import matplotlib.pyplot as plt
 from settings import GeneralSettings
@@ -19,37 +22,66 @@ class Plotter:
                 plt.close('all')
 
     @staticmethod
-    def plot_traffic_lights_per_lane_queues(queue_data, tls_ids, tls_controlled_lanes):
-        if GeneralSettings.plot_statistics:
-            for tl_id in tls_ids:
-                plt.figure(figsize=(30, 15))
-                plt.title('Traffic light [{}] per lane queue size.'.format(tl_id))
-                data = np.zeros((len(tls_controlled_lanes[tl_id]), len(queue_data)))
-                for j, tl_lanes in enumerate(queue_data):
-                    for i, cl in enumerate(tls_controlled_lanes[tl_id]):
-                        data[i][j] = tl_lanes[tl_id][cl]
-                for i, lane in enumerate(tls_controlled_lanes[tl_id]):
-                    plt.plot(range(0, len(queue_data)), data[i][:], label=lane)
-                plt.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
-                plt.xlabel('Time steps')
-                plt.ylabel('Queue length in meters.')
-                plt.savefig('{}.png'.format(GeneralSettings.statistics_output_dir + '/tl_' + tl_id + '_queue_per_lane'))
-                plt.close('all')
+    def plot_traffic_lights_per_lane_queues(tl_id, lanes, queues, output_file):
+        plt.figure(figsize=(30, 15))
+        plt.title('Traffic light [{}] per lane queue size.'.format(tl_id))
+        for i, lane in enumerate(lanes):
+            plt.plot(np.arange(queues.shape[0]), queues[:, i], label=lane)
+        plt.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
+        plt.xlabel('Time steps')
+        plt.ylabel('Queue length in meters.')
+        plt.savefig(output_file)
+        plt.close('all')
 
     @staticmethod
-    def plot_vehicle_stats(speed, wait_time, allowed_speed, vehicle_id):
-        if GeneralSettings.plot_statistics:
-            plt.figure(figsize=(30, 15))
-            plt.title('Vehicle [{}] speed, wait, stopped stats'.format(vehicle_id))
-            speed_patch = mpatches.Patch(color='green', label='Vehicle speed [km/h]')
-            wait_patch = mpatches.Patch(color='red', label='Vehicle wait time [s]')
-            allowed_speed_patch = mpatches.Patch(color='yellow', label='Allowed speed [km/h]')
-            plt.legend(handles=[speed_patch, wait_patch, allowed_speed_patch])
-            plt.xlabel('Time steps')
-            plt.grid(True)
-            x_os = range(0, len(speed))
-            plt.plot(x_os, np.multiply(np.array(speed), 3.6), 'g',
-                     x_os, np.array(wait_time), 'r',
-                     x_os, np.multiply(np.array(allowed_speed), 3.6), 'y')
-            plt.savefig('{}.png'.format(GeneralSettings.statistics_output_dir + '/vehicle_' + vehicle_id))
-            plt.close('all')
+    def plot_vehicle_stats(speed, wait_time, allowed_speed, vehicle_id, output_file):
+        plt.figure(figsize=(30, 15))
+        plt.title('Vehicle [{}] speed, wait, stopped stats'.format(vehicle_id))
+        speed_patch = mpatches.Patch(color='green', label='Vehicle speed [km/h]')
+        wait_patch = mpatches.Patch(color='red', label='Vehicle wait time [s]')
+        allowed_speed_patch = mpatches.Patch(color='yellow', label='Allowed speed [km/h]')
+        plt.legend(handles=[speed_patch, wait_patch, allowed_speed_patch])
+        plt.xlabel('Time steps')
+        plt.grid(True)
+        x_os = np.arange(len(speed))
+        plt.plot(x_os, np.multiply(speed, 3.6), 'g',
+                 x_os, wait_time, 'r',
+                 x_os, np.multiply(allowed_speed, 3.6), 'y')
+        plt.savefig(output_file)
+        plt.close('all')
+
+    @staticmethod
+    def plot_route_results(title, nodes, visited, path, output_file):
+        plt.figure(figsize=(15, 15))
+        plt.title(title)
+        plt.plot(nodes[:, 0], nodes[:, 1], 'bo',
+                 visited[:, 0], visited[:, 1], 'go',
+                 path[:, 0], path[:, 1], 'rs')
+        plt.savefig(output_file)
+        plt.close('all')
+
+    @staticmethod
+    def plot_landmarks(nodes, landmarks, output_file):
+        plt.figure(figsize=(15, 15))
+        plt.plot(nodes[:, 0], nodes[:, 1], 'bo', landmarks[:, 0], landmarks[:, 1], 'ro')
+        plt.savefig(output_file)
+        plt.close('all')
+
+    @staticmethod
+    def render_job(job_file):
+        """ Renders plot inputs saved by PlotJobs. """
+        data = np.load(job_file)
+        kind = str(data['kind'])
+        output_file = str(data['output_file'])
+        if kind == 'vehicle_stats':
+            Plotter.plot_vehicle_stats(data['speed'], data['wait_time'], data['allowed_speed'],
+                                       str(data['vehicle_id']), output_file)
+        elif kind == 'tl_lane_queues':
+            Plotter.plot_traffic_lights_per_lane_queues(str(data['tl_id']), list(data['lanes']), data['queues'],
+                                                        output_file)
+        elif kind == 'route_results':
+            Plotter.plot_route_results(str(data['title']), data['nodes'], data['visited'], data['path'], output_file)
+        elif kind == 'landmarks':
+            Plotter.plot_landmarks(data['nodes'], data['landmarks'], output_file)
+        else:
+            raise ValueError("Invalid plot job kind: {}".format(kind))
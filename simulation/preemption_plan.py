@@ -0,0 +1,122 @@
+import collections
+import operator
+
+from road_map_data import RoadMapData
+from tl_topology import TLTopology
+
+
+class PreemptionPlan:
+    """
+    Preemption facts of a single TL, which depend only on the TL topology, its default program and the edges
+    the vehicle uses to enter and leave the intersection. Plans are cached per (tl, in edge, out edge) and
+    shared by all vehicles and runs on the same network.
+    """
+    cache = {}
+    network = None
+
+    def __init__(self, topology, tl_program, tl_id, in_edge_id, out_edge_id):
+        self.tl_id = tl_id
+        self.in_edge_id = in_edge_id
+        self.in_lanes = topology.get_incoming_lanes(tl_id, in_edge_id)
+        self.in_lane = self.in_lanes[0]
+        if out_edge_id is not None:
+            self.out_lane = topology.get_outgoing_lane(tl_id, out_edge_id)
+        else:
+            self.out_lane = PreemptionPlan._find_next_lane(self.in_lane)
+        self.out_edge_id = TLTopology.lane_edge(self.out_lane) if self.out_lane else None
+
+        controlled_lanes = topology.controlled_lanes[tl_id]
+        first_index, last_index = topology.get_incoming_index_range(tl_id, in_edge_id)
+        self.in_indices = [i for i in range(first_index, last_index + 1) if controlled_lanes[i] in self.in_lanes]
+        self.target_phase_index = tl_program.find_phase_index(first_index, last_index)
+
+        in_lane_indices = [i for i, x in enumerate(controlled_lanes) if x == self.in_lane]
+        self.mediate_phase_index = tl_program.find_phase_index(in_lane_indices[0], in_lane_indices[-1])
+
+        immediate_indices = [i for i, x in enumerate(controlled_lanes) if x.startswith(self.in_lane[:-4])]
+        if immediate_indices:
+            immediate_state = list('r' * len(controlled_lanes))
+            for i in immediate_indices:
+                immediate_state[i] = 'G'
+            self.immediate_state = "".join(immediate_state)
+        else:
+            self.immediate_state = None
+
+        self.controlled_lanes_indexes = PreemptionPlan._get_controlled_lanes_indexes(controlled_lanes,
+                                                                                     self.in_lanes)
+        if self.target_phase_index is not None and self.out_lane:
+            self.minimal_blockage_state = self._get_minimal_blockage_state(
+                topology.controlled_links[tl_id], tl_program.phase_states[self.target_phase_index])
+        else:
+            self.minimal_blockage_state = None
+
+    @staticmethod
+    def get(topology, tl_program, tl_id, in_edge_id, out_edge_id):
+        key = (tl_id, in_edge_id, out_edge_id)
+        if key not in PreemptionPlan.cache:
+            PreemptionPlan.cache[key] = PreemptionPlan(topology, tl_program, tl_id, in_edge_id, out_edge_id)
+        return PreemptionPlan.cache[key]
+
+    @staticmethod
+    def reset_cache(network):
+        """ Cached plans are valid only for the network they were built on. """
+        if PreemptionPlan.network != network:
+            PreemptionPlan.cache.clear()
+            PreemptionPlan.network = network
+
+    def _get_minimal_blockage_state(self, controlled_links, target_phase_state):
+        in_lanes = self.in_lanes
+        in_lane = self.in_lane
+        indices = self.in_indices
+        controlled_lanes_indexes = self.controlled_lanes_indexes
+        new_phase = list(target_phase_state)
+        out_lane = self.out_lane[1:] if self.out_lane.startswith('-') else '-' + self.out_lane
+        # Modify state to prevent crossing IV path
+        for i, signal in enumerate(new_phase):
+            if i not in indices and signal.lower() == 'g':
+                cl = controlled_links[i][0]
+                cl_in_lane = cl[0]
+                cl_out_lane = cl[1][1:] if cl[1].startswith('-') else '-' + cl[1]
+                if out_lane == cl_out_lane:
+                    new_phase[i] = 'r'
+                elif out_lane == cl_in_lane:
+                    try:
+                        if cl_out_lane not in in_lanes and controlled_lanes_indexes[cl_out_lane] >= \
+                                controlled_lanes_indexes[cl_in_lane]:
+                            new_phase[i] = 'r'
+                    except KeyError:
+                        new_phase[i] = 'r'
+                else:
+                    try:
+                        if controlled_lanes_indexes[cl_in_lane] > controlled_lanes_indexes[out_lane] > \
+                                controlled_lanes_indexes[cl_out_lane] >= controlled_lanes_indexes[in_lane]:
+                            new_phase[i] = 'r'
+                        elif controlled_lanes_indexes[cl_in_lane] < controlled_lanes_indexes[out_lane] < \
+                                controlled_lanes_indexes[cl_out_lane] < max(controlled_lanes_indexes.values()):
+                            new_phase[i] = 'r'
+                    except KeyError:
+                        new_phase[i] = 'r'
+        return "".join(new_phase)
+
+    @staticmethod
+    def _find_next_lane(lane):
+        try:
+            edge = RoadMapData.road_map.getEdge(TLTopology.lane_edge(lane))
+            return edge.getOutgoing().values()[0][0].getToLane().getID()
+        except (KeyError, IndexError):
+            return None
+
+    @staticmethod
+    def _get_controlled_lanes_indexes(controlled_lanes, in_lanes):
+        # Prepare dictionary -> lane: index
+        indexes = {lane: controlled_lanes.index(lane) for lane in set(controlled_lanes)}
+
+        # Normalize dictionary, that in_line has index 0
+        counts = collections.Counter(controlled_lanes)
+        lanes_count = len(controlled_lanes)
+
+        while min([indexes[in_lane] for in_lane in in_lanes]) != 0:
+            key_of_max_index_value = max(indexes.iteritems(), key=operator.itemgetter(1))[0]
+            for lane in indexes.keys():
+                indexes[lane] = (indexes[lane] + counts[key_of_max_index_value]) % lanes_count
+        return indexes
@@ -1,4 +1,10 @@
-class PreemptionRequest:
+from collections import namedtuple
+
+
+class PreemptionRequest(object):
+    __slots__ = ('step', 'vehicle_id', 'tl_id', 'dist_to_tl', 'preemption_mode', 'log', 'tl_state', 'phase_duration',
+                 'tl_definition')
+
     def __init__(self, step, vehicle_id, tl_id, dist_to_tl, preemption_mode, log, tl_state=None, phase_duration=None,
                  tl_definition=None):
         self.step = step
@@ -12,10 +18,17 @@ class PreemptionRequest:
         self.tl_definition = tl_definition
 
 
-class ResetRequest:
+class ResetRequest(object):
+    __slots__ = ('step', 'reset_mode', 'tl_id', 'vehicle_id', 'prev_phase')
+
     def __init__(self, step, reset_mode, tl_id, vehicle_id, prev_phase):
         self.step = step
         self.reset_mode = reset_mode
         self.tl_id = tl_id
         self.vehicle_id = vehicle_id
         self.prev_phase = prev_phase
+
+
+class RtcLogEntry(namedtuple('RtcLogEntry', ['step', 'vehicle_id', 'action', 'tl_id', 'preemption_mode', 'msg'])):
+    """ Single RTC log row, a tuple instead of a dict per entry. """
+    __slots__ = ()
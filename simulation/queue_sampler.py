@@ -0,0 +1,76 @@
+import numpy as np
+import traci.constants as tc
+from traci import TraCIException
+
+from lane_queue_data import LaneQueueData
+
+
+class QueueSampler:
+    """
+    Halting numbers of TLs monitored by any vehicle in the current step. Controlled lanes of monitored TLs are
+    subscribed, so each lane is read once per step regardless of how many vehicles monitor its TL.
+    Lanes of TLs that are no longer monitored are unsubscribed.
+
+    If lane queue recording is enabled, queue lengths of recorded lanes are estimated from the same
+    subscriptions every step, which replaces SUMO queue output.
+    """
+    subscription_vars = [tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.LAST_STEP_LENGTH]
+    # Default SUMO minimal gap between standing vehicles [m]
+    min_gap = 2.5
+
+    def __init__(self, traci_conn, tl_topology, record_lane_queues=False):
+        self.traci_conn = traci_conn
+        self.topology = tl_topology
+        self.subscribed_lanes = set()
+        self.lane_queues = LaneQueueData() if record_lane_queues else None
+
+    def record_tl_lanes(self, tl_ids):
+        if self.lane_queues is not None:
+            for tl_id in tl_ids:
+                self.lane_queues.add_lanes(sorted(self.topology.controlled_lane_sets[tl_id]))
+
+    def sample(self, tl_ids):
+        """ Returns TL id: total halting number on its controlled lanes. """
+        lanes = set()
+        for tl_id in tl_ids:
+            lanes.update(self.topology.controlled_lane_sets[tl_id])
+        if self.lane_queues is not None:
+            lanes.update(self.lane_queues.lane_ids)
+        self._update_subscriptions(lanes)
+
+        lane_values = {lane_id: self._get_lane_values(lane_id) for lane_id in lanes}
+        if self.lane_queues is not None:
+            self.lane_queues.append_row(np.array(
+                [halting * (length + QueueSampler.min_gap) if halting else 0.
+                 for halting, length in [lane_values[lane_id] for lane_id in self.lane_queues.lane_ids]]))
+        return {tl_id: sum([lane_values[lane_id][0] for lane_id in self.topology.controlled_lane_sets[tl_id]])
+                for tl_id in tl_ids}
+
+    def close(self):
+        """ Removes subscriptions, so a reused SUMO connection does not keep sampling lanes of the last run. """
+        self._update_subscriptions(set())
+
+    def _update_subscriptions(self, lanes):
+        for lane_id in self.subscribed_lanes - lanes:
+            try:
+                self.traci_conn.lane.unsubscribe(lane_id)
+            except TraCIException:
+                pass
+        for lane_id in lanes - self.subscribed_lanes:
+            try:
+                self.traci_conn.lane.subscribe(lane_id, QueueSampler.subscription_vars)
+            except TraCIException:
+                continue
+        self.subscribed_lanes = lanes
+
+    def _get_lane_values(self, lane_id):
+        """ Returns halting number and mean vehicle length of the lane. """
+        results = self.traci_conn.lane.getSubscriptionResults(lane_id)
+        if results and tc.LAST_STEP_VEHICLE_HALTING_NUMBER in results:
+            return results[tc.LAST_STEP_VEHICLE_HALTING_NUMBER], results.get(tc.LAST_STEP_LENGTH, 0.)
+        # Subscription results are not available yet
+        try:
+            return self.traci_conn.lane.getLastStepHaltingNumber(lane_id), \
+                self.traci_conn.lane.getLastStepLength(lane_id)
+        except TraCIException:
+            return 0, 0.
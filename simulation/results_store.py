@@ -0,0 +1,138 @@
+import os
+import glob
+import uuid
+import sqlite3
+import itertools
+import collections
+import numpy as np
+from settings import GeneralSettings
+
+
+class ResultsStore:
+    """
+    Simulation results in SQLite, one table per record type with configuration columns. Every worker writes
+    its own shard file, so parallel workers do not need a lock. Shards are merged into a single database
+    when all workers are finished. Rows are inserted in batches.
+    """
+    file_name = 'results.sqlite'
+    shard_prefix = 'results_shard_'
+    batch_size = 10000
+
+    # density is max number of vehicles in the simulation
+    config_columns = ['route', 'preemption_mode', 'reset_mode', 'density', 'preemption_range', 'iteration']
+    tables = collections.OrderedDict([
+        ('vehicle_steps', ['vehicle_id', 'time_step', 'speed_kmh', 'wait_time', 'allowed_speed_kmh']),
+        ('vehicle_tl_queues', ['vehicle_id', 'tl_key', 'step_index', 'halting_number']),
+        ('route_trips', ['vehicle_id', 'start_step', 'finish_step', 'duration', 'return_start_step',
+                         'return_finish_step', 'return_duration']),
+        ('tl_lane_queues', ['tl_id', 'lane_id', 'time_step', 'queue_length']),
+        ('rtc_logs', ['step', 'vehicle_id', 'action', 'tl_id', 'mode', 'msg'])])
+
+    def __init__(self, directory, label):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.path = os.path.join(directory, '{}{}_{}.sqlite'.format(ResultsStore.shard_prefix, label, uuid.uuid4()))
+        self.db = ResultsStore._connect(self.path)
+        self.pending = {table: [] for table in ResultsStore.tables}
+
+    @staticmethod
+    def _connect(path):
+        db = sqlite3.connect(path)
+        db.execute('PRAGMA synchronous = OFF')
+        for table, columns in ResultsStore.tables.iteritems():
+            db.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(table, ', '.join(ResultsStore.config_columns +
+                                                                                    columns)))
+        return db
+
+    @staticmethod
+    def get_vehicle_config(vehicle):
+        return (vehicle.route_name, vehicle.preemption_mode.value, vehicle.reset_mode.value,
+                GeneralSettings.max_num_vehicles, vehicle.tl_controller.preemption_range, GeneralSettings.iteration)
+
+    @staticmethod
+    def get_run_config(vehicles):
+        """ Configuration of run level records, columns which differ between vehicles are not set. """
+        configs = [ResultsStore.get_vehicle_config(vehicle) for vehicle in vehicles]
+        if not configs:
+            return (None, None, None, GeneralSettings.max_num_vehicles, None, GeneralSettings.iteration)
+        return tuple(values[0] if len(set(values)) == 1 else None for values in zip(*configs))
+
+    # <editor-fold desc="Writer">
+
+    def write(self, table, config, rows):
+        pending = self.pending[table]
+        pending.extend(config + tuple(row) for row in rows)
+        if len(pending) >= ResultsStore.batch_size:
+            self._flush_table(table)
+
+    def _flush_table(self, table):
+        pending = self.pending[table]
+        if pending:
+            self.db.executemany('INSERT INTO {} VALUES ({})'.format(table, ', '.join('?' * len(pending[0]))), pending)
+            self.pending[table] = []
+
+    def close(self):
+        for table in ResultsStore.tables:
+            self._flush_table(table)
+        self.db.commit()
+        self.db.close()
+
+    # </editor-fold>
+
+    # <editor-fold desc="Record types">
+
+    def write_vehicle_stats(self, speed, wait_time, allowed_speed, vehicle):
+        if GeneralSettings.export_vehicle_stats:
+            time_steps = np.arange(vehicle.start_delay, vehicle.start_delay + len(speed))
+            self.write('vehicle_steps', ResultsStore.get_vehicle_config(vehicle),
+                       itertools.izip(itertools.repeat(vehicle.id), time_steps.tolist(),
+                                      np.multiply(speed, 3.6, dtype=np.float64).tolist(), wait_time.tolist(),
+                                      np.multiply(allowed_speed, 3.6, dtype=np.float64).tolist()))
+
+    def write_vehicle_route_queues(self, vehicle, queue_data):
+        if GeneralSettings.export_vehicle_route_stats:
+            config = ResultsStore.get_vehicle_config(vehicle)
+            for tl_key, tl_data in queue_data.iteritems():
+                self.write('vehicle_tl_queues', config,
+                           ((vehicle.id, tl_key, i, value) for i, value in enumerate(tl_data.tolist())))
+
+    def write_route_trips(self, vehicles):
+        if GeneralSettings.export_route_stats:
+            for vehicle in vehicles:
+                steps = vehicle.stats.start_finish_time_steps
+                if len(steps) < 2:
+                    print("IndexError: {}".format(steps))
+                    continue
+                row = [vehicle.id, steps[0], steps[1], steps[1] - steps[0], None, None, None]
+                if len(steps) > 3:
+                    row[4:] = [steps[2], steps[3], steps[3] - steps[2]]
+                self.write('route_trips', ResultsStore.get_vehicle_config(vehicle), [row])
+
+    def write_tl_lane_queues(self, config, queue_data, tls_ids, tls_controlled_lanes):
+        if GeneralSettings.export_tl_per_lane:
+            for tl_id in tls_ids:
+                lanes = list(tls_controlled_lanes[tl_id])
+                data = queue_data.get_lanes(lanes)
+                for i, lane_id in enumerate(lanes):
+                    self.write('tl_lane_queues', config,
+                               ((tl_id, lane_id, step, value) for step, value in enumerate(data[:, i].tolist())))
+
+    def write_rtc_logs(self, config, log_data):
+        if GeneralSettings.export_rtc_logs:
+            self.write('rtc_logs', config, log_data)
+
+    # </editor-fold>
+
+    @staticmethod
+    def merge(directory):
+        """ Moves rows of all shards in the directory into the single results database. """
+        db = ResultsStore._connect(os.path.join(directory, ResultsStore.file_name))
+        for shard in sorted(glob.glob(os.path.join(directory, ResultsStore.shard_prefix + '*.sqlite'))):
+            db.execute('ATTACH DATABASE ? AS shard', (shard,))
+            for table in ResultsStore.tables:
+                db.execute('INSERT INTO main.{0} SELECT * FROM shard.{0}'.format(table))
+            db.commit()
+            db.execute('DETACH DATABASE shard')
+            os.remove(shard)
+        db.close()
@@ -1,22 +1,28 @@
 import copy
 import uuid
+import collections
 import numpy as np
 from settings import PreemptionMode, ResetMode
-from preemption_request import ResetRequest
+from preemption_request import ResetRequest, RtcLogEntry
+from tl_program import TLProgram
+from tl_topology import TLTopology
 
 
 class RoadTrafficControl:
     def __init__(self, traci_conn):
         self.vehicle_service = None
         self.traci_conn = traci_conn
-        self.request_queue = []
+        self.tl_requests = collections.OrderedDict()
+        self.distance_to_tl_cache = {}
         self.reset_tl_queue = {}
         self.current_tl_preemptions = {}
         self.pending_mediate_preemptions = []
         self.prev_tl_phase = {}
-        self.default_tl_data = {tl_id: self._get_default_tls_program_data(tl_id)
-                                for tl_id in self.traci_conn.trafficlights.getIDList()}
+        self.topology = TLTopology(self.traci_conn)
+        self.default_tl_programs = {tl_id: TLProgram.from_logic(self._get_default_tls_program_data(tl_id))
+                                    for tl_id in self.traci_conn.trafficlights.getIDList()}
         self.logger = []
+        self.telemetry = None
 
     # <editor-fold desc="Pre process">
 
@@ -27,75 +33,124 @@ class RoadTrafficControl:
             return copy.deepcopy([x for x in data if x._subID == program][0])
         return copy.deepcopy(data[0])
 
-    def get_default_tl_state(self, tl_id):
-        return copy.deepcopy(self.default_tl_data[tl_id])
+    def get_default_tl_program(self, tl_id):
+        return self.default_tl_programs[tl_id]
 
     def set_vehicle_service_connection(self, vehicle_service):
         self.vehicle_service = vehicle_service
 
+    def set_telemetry(self, telemetry):
+        self.telemetry = telemetry
+
+    # </editor-fold>
+
+    # <editor-fold desc="Checkpoint">
+
+    def get_checkpoint_state(self):
+        return {'tl_requests': self.tl_requests,
+                'reset_tl_queue': self.reset_tl_queue,
+                'current_tl_preemptions': self.current_tl_preemptions,
+                'pending_mediate_preemptions': self.pending_mediate_preemptions,
+                'prev_tl_phase': self.prev_tl_phase,
+                'logger': self.logger}
+
+    def restore_checkpoint_state(self, state):
+        self.tl_requests = state['tl_requests']
+        self.reset_tl_queue = state['reset_tl_queue']
+        self.current_tl_preemptions = state['current_tl_preemptions']
+        self.pending_mediate_preemptions = state['pending_mediate_preemptions']
+        self.prev_tl_phase = state['prev_tl_phase']
+        self.logger = state['logger']
+
+        """ Programs set over TraCI are not part of the SUMO state, apply active preemptions again """
+        for tl_id, request in self.current_tl_preemptions.iteritems():
+            if request.tl_definition is not None:
+                self.traci_conn.trafficlights.setCompleteRedYellowGreenDefinition(tl_id, request.tl_definition)
+                self.traci_conn.trafficlights.setProgram(tl_id, request.tl_definition._subID)
+            elif request.tl_state is not None:
+                self.traci_conn.trafficlights.setRedYellowGreenState(tl_id, request.tl_state)
+                self.traci_conn.trafficlights.setPhaseDuration(tl_id, request.phase_duration)
+
     # </editor-fold>
 
     # <editor-fold desc="Preemption">
 
     def request_preemption(self, request):
-        self.request_queue.append(request)
+        if request.tl_id in self.tl_requests:
+            self.tl_requests[request.tl_id].append(request)
+        else:
+            self.tl_requests[request.tl_id] = [request]
         self._log(request, 'preemption_request')
 
     def process_requests(self, step):
-        for i, request in enumerate(self.request_queue):
-            vehicle = self.vehicle_service.get_vehicle(request.vehicle_id)
-            tl_id_ = request.tl_id
-            tl_is_not_preempted = tl_id_ not in self.current_tl_preemptions
-
-            if tl_is_not_preempted \
-                    or (request.vehicle_id != self.current_tl_preemptions[
-                        tl_id_].vehicle_id and vehicle.get_distance_to_tl(tl_id_) < self.vehicle_service.get_vehicle(
-                        self.current_tl_preemptions[tl_id_].vehicle_id).get_distance_to_tl(tl_id_)) \
-                    or (request.vehicle_id == self.current_tl_preemptions[
-                        tl_id_].vehicle_id and (request.preemption_mode == PreemptionMode.IMMEDIATE
-                                                or request.preemption_mode == PreemptionMode.IMMEDIATE_WITH_MINIMAL_BLOCKAGE)):
-
-                if request.preemption_mode == PreemptionMode.IMMEDIATE or \
-                                request.preemption_mode == PreemptionMode.IMMEDIATE_WITH_MINIMAL_BLOCKAGE:
-
-                    """ Store prev TL program """
-                    if not (tl_id_ in self.prev_tl_phase and (
-                            self.prev_tl_phase[tl_id_]['preemption_mode'] is PreemptionMode.MEDIATE or
-                            self.prev_tl_phase[tl_id_][
-                                'preemption_mode'] is PreemptionMode.MEDIATE_FROM_START)):
-                        self.prev_tl_phase[tl_id_] = {
-                            'preemption_mode': request.preemption_mode,
-                            'tl_phase': self.traci_conn.trafficlights.getPhase(tl_id_)}
-
-                    """ Set preemption TL state """
-                    self.traci_conn.trafficlights.setRedYellowGreenState(tl_id_, request.tl_state)
-                    self.traci_conn.trafficlights.setPhaseDuration(tl_id_, request.phase_duration)
-                    self._store_preemption(request, step, tl_id_, vehicle)
-                    del self.request_queue[i]
-
-                elif request.preemption_mode == PreemptionMode.MEDIATE or \
-                                request.preemption_mode == PreemptionMode.MEDIATE_FROM_START:
-                    """ Store prev TL program """
+        """ Requests are bucketed per TL, so only contested TLs need vehicles distances. """
+        tl_requests = self.tl_requests
+        self.tl_requests = collections.OrderedDict()
+        self.distance_to_tl_cache.clear()
+        for tl_id_, requests in tl_requests.iteritems():
+            for request in requests:
+                self._process_request(step, tl_id_, request)
+
+    def _process_request(self, step, tl_id_, request):
+        vehicle = self.vehicle_service.get_vehicle(request.vehicle_id)
+
+        if self._is_request_accepted(request, tl_id_):
+            if request.preemption_mode == PreemptionMode.IMMEDIATE or \
+                            request.preemption_mode == PreemptionMode.IMMEDIATE_WITH_MINIMAL_BLOCKAGE:
+
+                """ Store prev TL program """
+                if not (tl_id_ in self.prev_tl_phase and (
+                        self.prev_tl_phase[tl_id_]['preemption_mode'] is PreemptionMode.MEDIATE or
+                        self.prev_tl_phase[tl_id_][
+                            'preemption_mode'] is PreemptionMode.MEDIATE_FROM_START)):
                     self.prev_tl_phase[tl_id_] = {
                         'preemption_mode': request.preemption_mode,
                         'tl_phase': self.traci_conn.trafficlights.getPhase(tl_id_)}
 
-                    """ Set preemption TL state """
-                    request.tl_definition._subID = str(uuid.uuid4())
-                    self.traci_conn.trafficlights.setCompleteRedYellowGreenDefinition(tl_id_, request.tl_definition)
-                    self.traci_conn.trafficlights.setProgram(tl_id_, request.tl_definition._subID)
-                    self._store_preemption(request, step, tl_id_, vehicle)
-                    del self.request_queue[i]
+                """ Set preemption TL state """
+                self.traci_conn.trafficlights.setRedYellowGreenState(tl_id_, request.tl_state)
+                self.traci_conn.trafficlights.setPhaseDuration(tl_id_, request.phase_duration)
+                self._store_preemption(request, step, tl_id_, vehicle)
+
+            elif request.preemption_mode == PreemptionMode.MEDIATE or \
+                            request.preemption_mode == PreemptionMode.MEDIATE_FROM_START:
+                """ Store prev TL program """
+                self.prev_tl_phase[tl_id_] = {
+                    'preemption_mode': request.preemption_mode,
+                    'tl_phase': self.traci_conn.trafficlights.getPhase(tl_id_)}
+
+                """ Set preemption TL state """
+                request.tl_definition._subID = str(uuid.uuid4())
+                self.traci_conn.trafficlights.setCompleteRedYellowGreenDefinition(tl_id_, request.tl_definition)
+                self.traci_conn.trafficlights.setProgram(tl_id_, request.tl_definition._subID)
+                self._store_preemption(request, step, tl_id_, vehicle)
 
-                else:
-                    raise ValueError("Unknown preemption mode.")
             else:
-                self._log_request(step, request, 'Request rejected.')
-                del self.request_queue[i]
+                raise ValueError("Unknown preemption mode.")
+        else:
+            self._log_request(step, request, 'Request rejected.')
+
+    def _is_request_accepted(self, request, tl_id_):
+        if tl_id_ not in self.current_tl_preemptions:
+            return True
+
+        current_vehicle_id = self.current_tl_preemptions[tl_id_].vehicle_id
+        if request.vehicle_id != current_vehicle_id:
+            return self._get_distance_to_tl(request.vehicle_id, tl_id_) < \
+                   self._get_distance_to_tl(current_vehicle_id, tl_id_)
+        return request.preemption_mode == PreemptionMode.IMMEDIATE \
+            or request.preemption_mode == PreemptionMode.IMMEDIATE_WITH_MINIMAL_BLOCKAGE
+
+    def _get_distance_to_tl(self, vehicle_id, tl_id):
+        """ Distance of the vehicle to the TL is calculated at most once per simulation step. """
+        key = (vehicle_id, tl_id)
+        if key not in self.distance_to_tl_cache:
+            self.distance_to_tl_cache[key] = self.vehicle_service.get_vehicle(vehicle_id).get_distance_to_tl(tl_id)
+        return self.distance_to_tl_cache[key]
 
     def _store_preemption(self, request, step, tl_id_, vehicle):
         if tl_id_ in self.current_tl_preemptions:
-            curr = copy.deepcopy(self.current_tl_preemptions[tl_id_])
+            curr = self.current_tl_preemptions[tl_id_]
             if curr.preemption_mode == PreemptionMode.MEDIATE or \
                             curr.preemption_mode == PreemptionMode.MEDIATE_FROM_START:
                 self.pending_mediate_preemptions.append(curr)
@@ -104,7 +159,7 @@ class RoadTrafficControl:
                 self.vehicle_service.get_vehicle(curr.vehicle_id).preemption_rejected(tl_id_, step)
                 self._log_request(step, request, 'Request rejected.')
 
-        self.current_tl_preemptions[tl_id_] = copy.deepcopy(request)
+        self.current_tl_preemptions[tl_id_] = request
         vehicle.stats.add_checkpoint(request.log, step)
         self._log(request, 'preemption')
         vehicle.preemption_accepted(tl_id_, step)
@@ -142,11 +197,13 @@ class RoadTrafficControl:
 
                 """ Process reset TL state """
                 if request.reset_mode == ResetMode.STANDARD:
-                    default_tl_state = self.get_default_tl_state(request.tl_id)
-                    self.traci_conn.trafficlights.setCompleteRedYellowGreenDefinition(request.tl_id, default_tl_state)
-                    self.traci_conn.trafficlights.setProgram(request.tl_id, default_tl_state._subID)
+                    default_tl_program = self.get_default_tl_program(request.tl_id)
+                    self.traci_conn.trafficlights.setCompleteRedYellowGreenDefinition(request.tl_id,
+                                                                                      default_tl_program.logic)
+                    self.traci_conn.trafficlights.setProgram(request.tl_id, default_tl_program.program_id)
                     self.traci_conn.trafficlights.setPhase(request.tl_id, request.prev_phase)
-                    reset_log = 'Resetting tl {} state. To programId: {}'.format(request.tl_id, default_tl_state._subID)
+                    reset_log = 'Resetting tl {} state. To programId: {}'.format(request.tl_id,
+                                                                                 default_tl_program.program_id)
                     self.vehicle_service.get_vehicle(request.vehicle_id).stats.add_checkpoint(reset_log, time_step)
                     self._log_reset(request, 'standard_reset', reset_log)
                 elif request.reset_mode == ResetMode.MAX_OUT_FLOW:
@@ -165,17 +222,17 @@ class RoadTrafficControl:
                 del self.pending_mediate_preemptions[i]
 
     def _reset_tl_immediate_with_min_blockage(self, request, time_step):
-        default_tl_state = self.get_default_tl_state(request.tl_id)
-        self.traci_conn.trafficlights.setCompleteRedYellowGreenDefinition(request.tl_id, default_tl_state)
-        self.traci_conn.trafficlights.setProgram(request.tl_id, default_tl_state._subID)
-        lanes = self.traci_conn.trafficlights.getControlledLanes(request.tl_id)
+        default_tl_program = self.get_default_tl_program(request.tl_id)
+        self.traci_conn.trafficlights.setCompleteRedYellowGreenDefinition(request.tl_id, default_tl_program.logic)
+        self.traci_conn.trafficlights.setProgram(request.tl_id, default_tl_program.program_id)
+        lanes = self.topology.controlled_lanes[request.tl_id]
         lanes_queue = [self.traci_conn.lane.getLastStepHaltingNumber(l_id) for l_id in lanes]
-        phases = default_tl_state._phases
         phases_score = np.array([sum(
-            [lanes_queue[pos] for pos, char in enumerate(phase._phaseDef) if char == 'G' or char == 'g'])
-            for phase in phases])
+            [lanes_queue[pos] for pos, char in enumerate(phase_state) if char == 'G' or char == 'g'])
+            for phase_state in default_tl_program.phase_states])
         self.traci_conn.trafficlights.setPhase(request.tl_id, np.argmax(phases_score))
-        reset_log = 'Resetting tl {} with max outflow. ProgramId: {}'.format(request.tl_id, default_tl_state._subID)
+        reset_log = 'Resetting tl {} with max outflow. ProgramId: {}'.format(request.tl_id,
+                                                                            default_tl_program.program_id)
         self.vehicle_service.get_vehicle(request.vehicle_id).stats.add_checkpoint(reset_log, time_step)
         self._log_reset(request, 'reset_max_outflow', reset_log)
 
@@ -194,16 +251,23 @@ class RoadTrafficControl:
     # </editor-fold>
 
     def _log(self, request, action):
-        self.logger.append(
-            {'step': request.step, 'vehicle_id': request.vehicle_id, 'action': action, 'tl_id': request.tl_id,
-             'preemption_mode': request.preemption_mode.name, 'msg': request.log})
+        self._append_log(RtcLogEntry(request.step, request.vehicle_id, action, request.tl_id,
+                                     request.preemption_mode.name, request.log))
 
     def _log_reset(self, reset, action, msg=''):
-        self.logger.append(
-            {'step': reset.step, 'vehicle_id': reset.vehicle_id, 'action': action, 'tl_id': reset.tl_id,
-             'preemption_mode': reset.reset_mode.name, 'msg': msg})
+        self._append_log(RtcLogEntry(reset.step, reset.vehicle_id, action, reset.tl_id, reset.reset_mode.name, msg))
 
     def _log_request(self, step, request, action):
-        self.logger.append(
-            {'step': step, 'vehicle_id': request.vehicle_id, 'action': action, 'tl_id': request.tl_id,
-             'preemption_mode': request.preemption_mode.name, 'msg': ''})
+        self._append_log(RtcLogEntry(step, request.vehicle_id, action, request.tl_id,
+                                     request.preemption_mode.name, ''))
+
+    def _append_log(self, entry):
+        self.logger.append(entry)
+        if self.telemetry is not None and len(self.logger) >= self.telemetry.chunk_size:
+            self.telemetry.spill_logs(self.logger)
+            self.logger = []
+
+    def get_logs(self):
+        if self.telemetry is not None:
+            return self.telemetry.get_logs(self.logger)
+        return self.logger
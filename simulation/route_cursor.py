@@ -0,0 +1,54 @@
+import bisect
+
+
+class RouteCursor:
+    """
+    Progress of a vehicle along its route. Edge positions and TL indexes are indexed once per route,
+    so edge progress updates and passed TL detection are amortized O(1) per simulation step.
+    """
+    def __init__(self, edge_ids, route_tls):
+        self.edge_ids = edge_ids
+        self.current_edge_index = 0
+
+        # edge id: ascending positions on the route (edges can repeat on a route)
+        self.edge_positions = {}
+        for i, edge_id in enumerate(edge_ids):
+            if edge_id in self.edge_positions:
+                self.edge_positions[edge_id].append(i)
+            else:
+                self.edge_positions[edge_id] = [i]
+
+        # ordered TL indexes with pointer to the next TL and index of the next occurrence of the same TL
+        self.tl_indexes = sorted(route_tls.keys())
+        self.next_tl = 0
+        self.tl_next_occurrence = {}
+        last_occurrence = {}
+        for tl_index in reversed(self.tl_indexes):
+            tl_id = route_tls[tl_index]
+            if tl_id in last_occurrence:
+                self.tl_next_occurrence[tl_index] = last_occurrence[tl_id]
+            last_occurrence[tl_id] = tl_index
+
+    def advance(self, edge_id):
+        """ Moves to the first occurrence of edge at or after current position, returns False if there is none. """
+        if self.edge_ids[self.current_edge_index] == edge_id:
+            return True
+        positions = self.edge_positions.get(edge_id)
+        if positions is None:
+            return False
+        i = bisect.bisect_left(positions, self.current_edge_index)
+        if i == len(positions):
+            return False
+        self.current_edge_index = positions[i]
+        return True
+
+    def pop_passed_tls(self):
+        """ Returns route indexes of TLs passed since the last call. """
+        passed_tls = []
+        while self.next_tl < len(self.tl_indexes) and self.tl_indexes[self.next_tl] < self.current_edge_index:
+            passed_tls.append(self.tl_indexes[self.next_tl])
+            self.next_tl += 1
+        return passed_tls
+
+    def get_next_tl_occurrence(self, tl_index):
+        return self.tl_next_occurrence.get(tl_index)
@@ -0,0 +1,37 @@
+class RouteGeometry:
+    """
+    Cumulative lengths and free-flow travel times along a route. Route position is the distance from the start
+    of the route, so distance and ETA to any point on the route are a single subtraction.
+    """
+    speed_factor = 1.1
+
+    def __init__(self, edges):
+        self.edge_lengths = [edge.getLength() for edge in edges]
+        self.edge_speeds = [RouteGeometry.speed_factor * edge.getSpeed() for edge in edges]
+        self.lengths = [0.]
+        self.times = [0.]
+        for length, speed in zip(self.edge_lengths, self.edge_speeds):
+            self.lengths.append(self.lengths[-1] + length)
+            self.times.append(self.times[-1] + length / speed)
+
+    def get_total_length(self):
+        return self.lengths[-1]
+
+    def get_position(self, edge_index, lane_position=None):
+        """ Route position on the edge, end of the edge if lane position is not known (e.g. inside junction). """
+        if lane_position is None:
+            return self.lengths[edge_index + 1]
+        return self.lengths[edge_index] + min(lane_position, self.edge_lengths[edge_index])
+
+    def get_distance(self, end_index, position):
+        """ Distance from route position to the start of the edge with end index. """
+        return self.lengths[end_index] - position
+
+    def get_travel_time(self, end_index, edge_index, position):
+        """
+        Free-flow travel time from route position on edge with edge index to the start of the edge with end index.
+        """
+        if end_index <= edge_index:
+            return 0.
+        edge_time = (self.lengths[edge_index + 1] - position) / self.edge_speeds[edge_index]
+        return edge_time + self.times[end_index] - self.times[edge_index + 1]
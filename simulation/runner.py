@@ -1,12 +1,11 @@
 #!/usr/bin/env python
 import os
 import sys
-import randomTrips
 import json
 import copy
 from sumolib import net
 from optparse import OptionParser
-from settings import TripSettings
+from settings import TripSettings, GeneralSettings
 from simulation_runner import SimulationRunner
 
 try:
@@ -26,6 +25,10 @@ def get_options():
     opt_parser.add_option("--nogui", action="store_true", default=False, help="run the commandline version of sumo")
     opt_parser.add_option("-C", "--config", action="store", type="string", dest="config_file",
                           default="../data_set/trnovo/config.json")
+    opt_parser.add_option("--resume", action="store_true", default=False,
+                          help="continue simulation from the last checkpoint")
+    opt_parser.add_option("--skip-plots", action="store_true", default=False,
+                          help="do not render plots after simulation, they can be rendered later by plot_pipeline.py")
     opt_parser_options, _ = opt_parser.parse_args()
     return opt_parser_options
 
@@ -80,10 +83,17 @@ def main():
 
     edges = net.readNet(road_map_file_path).getEdges()
     # prepare_trips(base_dir, data, edges, road_map_file_path, trip_settings)
-    SimulationRunner(copy.deepcopy(json_data), options.nogui, do_clean=True).run()
+    SimulationRunner(copy.deepcopy(json_data), options.nogui, do_clean=not options.resume,
+                     resume=options.resume).run()
+    if not options.skip_plots:
+        from plot_pipeline import render_plots
+        render_plots(GeneralSettings.plot_data_dir)
+    SimulationRunner.export_archive()
 
 
 def prepare_trips(base_dir, data, edges, road_map_file_path, trip_settings):
+    # randomTrips is found in SUMO tools, which are added to the path above
+    import randomTrips
     for vehicle, vehicle_options in data["vehicles"].items():
         route_file_name = '{}/{}.rou.xml'.format(base_dir, vehicle)
         trips_file_name = '{}/{}.trips.xml'.format(base_dir, vehicle)
@@ -0,0 +1,50 @@
+import math
+
+
+class RunningStats(object):
+    """
+    Online mean and variance of a sample (Welford), with confidence interval of the mean from Student's
+    t-distribution. Quantiles are approximated (normal quantile by bisection of erf, Cornish-Fisher expansion
+    for t), which is accurate to a few percent from 2 degrees of freedom on.
+    """
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def get_variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else float('inf')
+
+    def get_ci_width(self, confidence=0.95):
+        """ Full width of the two-sided confidence interval of the mean. """
+        if self.n < 2:
+            return float('inf')
+        t = RunningStats.t_quantile(0.5 + confidence / 2, self.n - 1)
+        return 2 * t * math.sqrt(self.get_variance() / self.n)
+
+    @staticmethod
+    def normal_quantile(p):
+        low, high = -10., 10.
+        for _ in range(0, 100):
+            middle = (low + high) / 2
+            if 0.5 * (1 + math.erf(middle / math.sqrt(2))) < p:
+                low = middle
+            else:
+                high = middle
+        return (low + high) / 2
+
+    @staticmethod
+    def t_quantile(p, df):
+        z = RunningStats.normal_quantile(p)
+        return z + (z ** 3 + z) / (4. * df) \
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96. * df ** 2) \
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384. * df ** 3) \
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160. * df ** 4)
@@ -15,6 +15,11 @@ class ResetMode(Enum):
     MAX_OUT_FLOW = 1
 
 
+class QueueCollectionMode(Enum):
+    QUEUE_OUTPUT = 0
+    IN_RUN = 1
+
+
 class PathFinderMode(Enum):
     SHORTEST = 1
     FASTEST = 2
@@ -43,6 +48,18 @@ class GeneralSettings:
     max_depart_delay = None
     base_dir = None
     num_of_iterations = 1
+    checkpoint_period = 0
+    checkpoint_dir = None
+    telemetry_spill = False
+    telemetry_chunk_size = 65536
+    telemetry_dir = None
+    queue_collection_mode = QueueCollectionMode.QUEUE_OUTPUT
+    results_store = False
+    results_dir = None
+    iteration = 0
+    plot_data_dir = None
+    route_files = None
+    reuse_sumo = False
 
     @staticmethod
     def initialize(settings, do_clean=True):
@@ -62,12 +79,36 @@ class GeneralSettings:
         GeneralSettings.max_num_vehicles = int(settings['max_num_vehicles'])
         GeneralSettings.max_depart_delay = settings['max_depart_delay']
         GeneralSettings.num_of_iterations = settings['num_of_iterations'] if 'num_of_iterations' in settings else 1
+        GeneralSettings.checkpoint_period = int(settings['checkpoint_period']) if 'checkpoint_period' in settings else 0
+        GeneralSettings.checkpoint_dir = settings['checkpoint_dir'] if 'checkpoint_dir' in settings \
+            else GeneralSettings.base_dir + '/checkpoint'
+        GeneralSettings.telemetry_spill = settings['telemetry_spill'] if 'telemetry_spill' in settings else False
+        GeneralSettings.telemetry_chunk_size = int(settings['telemetry_chunk_size']) \
+            if 'telemetry_chunk_size' in settings else 65536
+        GeneralSettings.telemetry_dir = settings['telemetry_dir'] if 'telemetry_dir' in settings \
+            else GeneralSettings.base_dir + '/telemetry'
+        GeneralSettings.queue_collection_mode = QueueCollectionMode(settings['queue_collection_mode']) \
+            if 'queue_collection_mode' in settings else QueueCollectionMode.QUEUE_OUTPUT
+        GeneralSettings.results_store = settings['results_store'] if 'results_store' in settings else False
+        GeneralSettings.results_dir = settings['results_dir'] if 'results_dir' in settings \
+            else GeneralSettings.statistics_output_dir
+        GeneralSettings.iteration = settings['iteration'] if 'iteration' in settings else 0
+        GeneralSettings.plot_data_dir = GeneralSettings.get_plot_data_dir(settings)
+        GeneralSettings.route_files = settings['route_files'] if 'route_files' in settings else None
+        GeneralSettings.reuse_sumo = settings['reuse_sumo'] if 'reuse_sumo' in settings else False
         if do_clean:
             GeneralSettings.clear_output_dir(GeneralSettings.debug_output_dir)
             GeneralSettings.clear_output_dir(GeneralSettings.statistics_output_dir)
+            GeneralSettings.clear_output_dir(GeneralSettings.plot_data_dir)
+
+    @staticmethod
+    def get_plot_data_dir(settings):
+        return settings['plot_data_dir'] if 'plot_data_dir' in settings else settings['debug_output_dir'] + '/plot_data'
 
     @staticmethod
     def clear_output_dir(directory):
+        if not os.path.exists(directory):
+            return
         for the_file in os.listdir(directory):
             file_path = os.path.join(directory, the_file)
             try:
@@ -84,3 +125,9 @@ class TripSettings:
         self.motorcycle_count = data['motorcycle_count']
         self.bus_count = data['bus_count']
         self.taxi_count = data['taxi_count']
+        # internal (NumPy generator on the loaded network) or randomTrips (SUMO tools)
+        self.generator = data['generator'] if 'generator' in data else 'internal'
+        if self.generator not in ['internal', 'randomTrips']:
+            raise ValueError("Unknown trip generator {}".format(self.generator))
+        # Edges are drawn with their length as weight (randomTrips --length), otherwise uniformly
+        self.length = data['length'] if 'length' in data else False
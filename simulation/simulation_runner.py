@@ -1,50 +1,110 @@
 #!/usr/bin/env python
+import time
+# Module import time is reported with other startup phases of the runner
+_import_start = time.time()
+import os
 import sys
 import traci
 import datetime
-import time
 import shutil
-import xml.etree.ElementTree as ET
-from collections import defaultdict
 
 from traci import FatalTraCIError
+from traci import TraCIException
 
-from plotter import Plotter
+from plot_jobs import PlotJobs
 from vehicleservice import VehicleService
-from settings import GeneralSettings
+from settings import GeneralSettings, QueueCollectionMode
 from road_traffic_control import RoadTrafficControl
 from csv_exporter import CsvExporter
 from sumolib import checkBinary
 from sumolib import net
 from road_map_data import RoadMapData
+from checkpoint import Checkpoint
+from preemption_plan import PreemptionPlan
+from queue_sampler import QueueSampler
+from vehicle_stats import Stats
+
+_import_time = time.time() - _import_start
 
 
 class SimulationRunner:
-    """ vehicle_mode_id is set if parallel run. """
-    def __init__(self, json_data, nogui=True, vehicle_mode_id=None, do_clean=False):
+    """
+    vehicle_mode_id is set if parallel run. If resume is set, simulation continues from the last checkpoint.
+    run_label distinguishes concurrent runs with the same vehicle mode (SUMO connection, checkpoint, outputs).
+    """
+    road_maps = {}
+
+    def __init__(self, json_data, nogui=True, vehicle_mode_id=None, do_clean=False, resume=False, run_label=None):
+        self.startup_times = [('module imports', _import_time)]
+        phase_start = time.time()
         GeneralSettings.initialize(json_data['general'], do_clean)
         road_map_file_path = json_data['map']['map_location']
-        RoadMapData.initialize(net.readNet(road_map_file_path),
+        RoadMapData.initialize(SimulationRunner.get_road_map(road_map_file_path),
                                json_data['map']['edges_occupancy_file'],
                                json_data['map']['landmarks_num'])
+        phase_start = self._add_startup_time('settings and road map', phase_start)
 
         # start SUMO and store connection
-        self.conn_label = "v_mode_" + str(vehicle_mode_id) if vehicle_mode_id is not None else "sim_0"
-        traci.start([checkBinary('sumo') if nogui else checkBinary('sumo-gui'),
-                     "-c", "{}/map.sumo.cfg".format(GeneralSettings.base_dir),
-                     "--no-warnings", "True",
-                     "--max-depart-delay", GeneralSettings.max_depart_delay],
-                    label=self.conn_label)
-        self.conn = traci._connections[self.conn_label]
+        if run_label is not None:
+            self.conn_label = run_label
+        else:
+            self.conn_label = "v_mode_" + str(vehicle_mode_id) if vehicle_mode_id is not None else "sim_0"
+        sumo_cmd = [checkBinary('sumo') if nogui else checkBinary('sumo-gui'),
+                    "-c", "{}/map.sumo.cfg".format(GeneralSettings.base_dir),
+                    "--no-warnings", "True",
+                    "--max-depart-delay", GeneralSettings.max_depart_delay]
+        if GeneralSettings.route_files:
+            sumo_cmd += ["--route-files", ",".join(GeneralSettings.route_files)]
+        self.queue_output_file = GeneralSettings.debug_output_dir + '/queue.xml'
+        # SUMO truncates queue output when it is started again on resume, checkpoints keep lane queues sampled in run
+        record_lane_queues = GeneralSettings.queue_collection_mode is QueueCollectionMode.IN_RUN \
+            or GeneralSettings.checkpoint_period > 0 or resume
+        if record_lane_queues or vehicle_mode_id is not None or run_label is not None:
+            # Lane queues are sampled during the run or not read by parallel runs, disable queue output of the whole
+            # network, which would be written for every parallel job
+            sumo_cmd += ["--queue-output", ""]
+        self.sumo_cmd = sumo_cmd
+        if GeneralSettings.reuse_sumo:
+            from sumo_connection_pool import SumoConnectionPool
+            self.conn = SumoConnectionPool.acquire(sumo_cmd, self.conn_label)
+        else:
+            traci.start(sumo_cmd, label=self.conn_label)
+            self.conn = traci._connections[self.conn_label]
+        phase_start = self._add_startup_time('SUMO start', phase_start)
 
         # Init Road traffic control center
         self.rtc = RoadTrafficControl(self.conn)
-
-        # Init Vehicle service
-        self.vehicle_service = VehicleService(json_data, self.conn, self.rtc, vehicle_mode_id)
+        phase_start = self._add_startup_time('road traffic control', phase_start)
+
+        # Per-step telemetry is spilled to disk during the run if enabled, vehicle stats register on creation
+        self.telemetry = None
+        if GeneralSettings.telemetry_spill:
+            from telemetry import Telemetry
+            self.telemetry = Telemetry(GeneralSettings.telemetry_dir, self.conn_label,
+                                       GeneralSettings.telemetry_chunk_size, resume)
+        Stats.telemetry = self.telemetry
+        self.rtc.set_telemetry(self.telemetry)
+
+        # Init Vehicle service, preemption plans are precomputed when routes are set
+        self.step = 0
+        self.checkpoint_dir = os.path.join(GeneralSettings.checkpoint_dir, self.conn_label)
+        checkpoint = Checkpoint.load(self.checkpoint_dir) if resume else None
+        PreemptionPlan.reset_cache(road_map_file_path)
+        self.vehicle_service = VehicleService(json_data, self.conn, self.rtc, vehicle_mode_id,
+                                              is_restored=checkpoint is not None)
         self.rtc.set_vehicle_service_connection(self.vehicle_service)
+        self.queue_sampler = QueueSampler(self.conn, self.rtc.topology, record_lane_queues)
+        self.queue_sampler.record_tl_lanes(self.get_lane_tls_data()[1])
+        phase_start = self._add_startup_time('vehicles and routes', phase_start)
+
+        if resume:
+            self._restore_checkpoint(checkpoint)
+            self._add_startup_time('checkpoint restore', phase_start)
 
         if GeneralSettings.debug_print:
+            print('\n****** STARTUP TIMES ******')
+            for phase, seconds in self.startup_times:
+                print('\t{}: {:.1f} ms'.format(phase, seconds * 1000))
             print('\n****** MAP STATISTICS ******')
             print('\tNumber of edges: {}'.format(len(RoadMapData.road_map.getEdges())))
             print('\tNumber of nodes: {}\n'.format(len(RoadMapData.road_map.getNodes())))
@@ -54,6 +114,22 @@ class SimulationRunner:
                                                          for edge in RoadMapData.road_map.getEdges()
                                                          for lane in edge.getLanes()])))
 
+    @staticmethod
+    def get_road_map(road_map_file_path):
+        """ Road map is read once per process and reused by following simulations on the same map. """
+        if road_map_file_path not in SimulationRunner.road_maps:
+            SimulationRunner.road_maps.clear()
+            # Landmarks are nodes of the previous road map
+            from alt import Alt
+            Alt.landmarks = None
+            SimulationRunner.road_maps[road_map_file_path] = net.readNet(road_map_file_path)
+        return SimulationRunner.road_maps[road_map_file_path]
+
+    def _add_startup_time(self, phase, phase_start):
+        now = time.time()
+        self.startup_times.append((phase, now - phase_start))
+        return now
+
     def run(self):
         if not self.vehicle_service:
             raise ValueError("Vehicle service is not set.")
@@ -91,21 +167,16 @@ class SimulationRunner:
                 self.post_parallel_simulation(lock)
 
     def simulate(self):
-        """prepare intervention vehicle route"""
-        vehicle_queue = {}
-        for vehicle_id, vehicle in self.vehicle_service.vehicles.iteritems():
-            vehicle_queue[vehicle_id] = vehicle.start_delay
-
         """execute the TraCI control loop"""
-        step = 0
+        step = self.step
 
         while self.conn.simulation.getMinExpectedNumber() > 0 and self.any_non_finished_intervention_vehicle(step):
             self.conn.simulationStep()
 
             self.preserve_max_number_of_vehicles()
 
-            self.insert_intervention_vehicle(step, vehicle_queue)
-            self.is_destination_reached(step, vehicle_queue)
+            self.insert_intervention_vehicle(step)
+            self.is_destination_reached(step)
 
             self.vehicle_preemption(step)
             self.rtc.process_reset_tl_queue(step)
@@ -114,8 +185,55 @@ class SimulationRunner:
 
             self.update_vehicle_stats(step)
             step += 1
+            self.step = step
+            if GeneralSettings.checkpoint_period and step % GeneralSettings.checkpoint_period == 0:
+                self.save_checkpoint()
         print "Simulation finished!"
 
+    # <editor-fold desc="Checkpoint">
+
+    def save_checkpoint(self):
+        Checkpoint.save(self.checkpoint_dir, self.step, self.conn, {
+            'vehicle_service': self.vehicle_service.get_checkpoint_state(),
+            'rtc': self.rtc.get_checkpoint_state(),
+            'telemetry': self.telemetry.get_checkpoint_state() if self.telemetry is not None else None,
+            'lane_queues': self.queue_sampler.lane_queues})
+        if GeneralSettings.debug_print:
+            print("Checkpoint saved at step {}.".format(self.step))
+
+    def _restore_checkpoint(self, checkpoint):
+        if checkpoint is None:
+            print("No checkpoint found in {}, starting from step 0.".format(self.checkpoint_dir))
+            if self.telemetry is not None:
+                self.telemetry.restore_checkpoint_state(None)
+            return
+
+        sumo_state_file, step, controller_state = checkpoint
+        self.conn.simulation.loadState(sumo_state_file)
+        self.vehicle_service.restore_checkpoint_state(controller_state['vehicle_service'])
+        self.rtc.restore_checkpoint_state(controller_state['rtc'])
+        if self.telemetry is not None:
+            self.telemetry.restore_checkpoint_state(controller_state.get('telemetry'))
+        if self.queue_sampler.lane_queues is not None:
+            if controller_state.get('lane_queues') is not None:
+                self.queue_sampler.lane_queues = controller_state['lane_queues']
+            else:
+                print("Checkpoint has no lane queues, queues before step {} are zero.".format(step))
+                for _ in range(0, step):
+                    self.queue_sampler.lane_queues.add_row()
+            self.queue_sampler.record_tl_lanes(self.get_lane_tls_data()[1])
+        self.step = step
+
+        # Routes of vehicles, which are not yet inserted, are not part of the SUMO state
+        for vehicle in self.vehicle_service.get_queued_vehicles():
+            try:
+                self.conn.route.add(vehicle.route_id, vehicle.remaining_edges)
+            except TraCIException:
+                pass
+        print("Simulation resumed from checkpoint at step {}.".format(step))
+
+    # </editor-fold>
+
     def any_non_finished_intervention_vehicle(self, step):
         if step <= 300:
             return True
@@ -125,27 +243,23 @@ class SimulationRunner:
     def preserve_max_number_of_vehicles(self):
         if self.conn.vehicle.getIDCount() > GeneralSettings.max_num_vehicles:
             for departed_vehicle in self.conn.simulation.getDepartedIDList():
-                if departed_vehicle not in self.vehicle_service.vehicles.keys():
+                if departed_vehicle not in self.vehicle_service.vehicles:
                     self.conn.vehicle.remove(departed_vehicle)
 
-    def insert_intervention_vehicle(self, step, vehicle_queue):
-        if len(vehicle_queue) > 0:
-            if step in vehicle_queue.values():
-                for d_key, v in vehicle_queue.items():
-                    if v == step:
-                        vehicle = self.vehicle_service.get_vehicle(d_key)
-                        self.conn.vehicle.add(d_key, vehicle.route_id)
-                        self.conn.vehicle.setType(d_key, 'intervention_vehicle')
-
-                        """ Kljucni nastavitvi za simuliranje hitre voznje """
-                        self.conn.vehicle.setSpeedMode(d_key, 0)
-                        self.conn.vehicle.setSpeedFactor(d_key, 1.5)
-
-                        vehicle.stats.add_checkpoint('Vehicle added into simulation.', step)
-                        vehicle.stats.add_start_finish_checkpoint(step)
-                        vehicle.is_active = True
-                        vehicle_queue.pop(d_key, None)
-                        vehicle.post_insert_processing(step)
+    def insert_intervention_vehicle(self, step):
+        for vehicle in self.vehicle_service.pop_vehicles_to_insert(step):
+            d_key = vehicle.id
+            self.conn.vehicle.add(d_key, vehicle.route_id)
+            self.conn.vehicle.setType(d_key, 'intervention_vehicle')
+
+            """ Kljucni nastavitvi za simuliranje hitre voznje """
+            self.conn.vehicle.setSpeedMode(d_key, 0)
+            self.conn.vehicle.setSpeedFactor(d_key, 1.5)
+
+            vehicle.stats.add_checkpoint('Vehicle added into simulation.', step)
+            vehicle.stats.add_start_finish_checkpoint(step)
+            self.vehicle_service.activate(vehicle)
+            vehicle.post_insert_processing(step)
 
     def vehicle_preemption(self, step):
         for vehicle in self.vehicle_service.get_none_preemption_vehicles():
@@ -156,32 +270,41 @@ class SimulationRunner:
             vehicle.preempt(step)
             # vehicle.signalize_slow_down(step)
 
-    def is_destination_reached(self, step, vehicle_queue):
+    def is_destination_reached(self, step):
         try:
-            for vehicle_id, vehicle in self.vehicle_service.vehicles.items():
-                if vehicle_id in self.conn.simulation.getArrivedIDList():
-                    vehicle.stats.add_checkpoint('Vehicle reached destination.', step)
-                    vehicle.stats.add_start_finish_checkpoint(step)
-                    vehicle.is_active = False
-                    vehicle.is_finished = vehicle.is_one_way
-                    if not vehicle.is_one_way:
-                        # Prevent looping
-                        vehicle.is_one_way = True
-                        self.vehicle_service.set_return_route(vehicle_id, step)
-                        vehicle_queue[vehicle.id] = step + 20
-                        vehicle.stats.add_wait_gap(20)
-                        vehicle.stats.add_checkpoint('Vehicle added into insertion queue.', step)
+            for vehicle_id in self.conn.simulation.getArrivedIDList():
+                if vehicle_id not in self.vehicle_service.vehicles:
+                    continue
+                vehicle = self.vehicle_service.get_vehicle(vehicle_id)
+                vehicle.stats.add_checkpoint('Vehicle reached destination.', step)
+                vehicle.stats.add_start_finish_checkpoint(step)
+                self.vehicle_service.deactivate(vehicle, vehicle.is_one_way)
+                if not vehicle.is_one_way:
+                    # Prevent looping
+                    vehicle.is_one_way = True
+                    self.vehicle_service.set_return_route(vehicle_id, step)
+                    self.queue_sampler.record_tl_lanes(vehicle.stats.tls_on_the_route)
+                    self.vehicle_service.enqueue(vehicle.id, step + 20)
+                    vehicle.stats.add_wait_gap(20)
+                    vehicle.stats.add_checkpoint('Vehicle added into insertion queue.', step)
         except FatalTraCIError as e:
             print "Exception in is_destination_reached. Error: {}".format(e)
 
     def update_vehicle_stats(self, step):
-        for vehicle in self.vehicle_service.get_active_vehicles():
+        active_vehicles = self.vehicle_service.get_active_vehicles()
+        try:
+            monitored_tls = set(tl_id for vehicle in active_vehicles for tl_id in vehicle.stats.get_monitored_tls())
+            tl_queues = self.queue_sampler.sample(monitored_tls)
+        except FatalTraCIError as e:
+            print "Exception in update_vehicle_stats. Error: {}".format(e)
+            return
+        for vehicle in active_vehicles:
             try:
                 speed = self.conn.vehicle.getSpeed(vehicle.id)
                 waiting_time = self.conn.vehicle.getWaitingTime(vehicle.id)
                 lane_id = self.conn.vehicle.getLaneID(vehicle.id)
                 allowed_speed = self.conn.lane.getMaxSpeed(lane_id) if lane_id else 0
-                vehicle.stats.update(speed, waiting_time, allowed_speed, vehicle.is_one_way, self.conn)
+                vehicle.stats.update(speed, waiting_time, allowed_speed, vehicle.is_one_way, tl_queues)
             except FatalTraCIError as e:
                 print "Exception in update_vehicle_stats. Error: {}".format(e)
 
@@ -190,23 +313,61 @@ class SimulationRunner:
         lane_tls = {}
         tl_controlled_lanes = {}
         for tl_id in tls_ids:
-            controlled_lanes = set(self.conn.trafficlight.getControlledLanes(tl_id))
+            controlled_lanes = self.rtc.topology.controlled_lane_sets[tl_id]
             tl_controlled_lanes[tl_id] = controlled_lanes
             for lane_id in controlled_lanes:
                 lane_tls[lane_id] = [tl_id] if lane_id not in lane_tls else lane_tls[lane_id] + [tl_id]
         return lane_tls, tls_ids, tl_controlled_lanes
 
+    def get_route_duration(self):
+        """ Mean route duration of intervention vehicles, which finished their trips. """
+        durations = [vehicle.stats.get_route_duration() for vehicle in self.vehicle_service.vehicles.values()]
+        durations = [duration for duration in durations if duration is not None]
+        return float(sum(durations)) / len(durations) if durations else None
+
+    def finalize_telemetry(self):
+        if self.telemetry is not None:
+            self.telemetry.finalize()
+
+    def remove_telemetry(self):
+        if self.telemetry is not None:
+            self.telemetry.remove_files()
+
+    def write_results(self, queue_data=None, tls_ids=(), tls_controlled_lanes=None):
+        """ Writes statistics into own results store shard, which needs no lock. """
+        from results_store import ResultsStore
+        results_store = ResultsStore(GeneralSettings.results_dir, self.conn_label)
+        try:
+            self.vehicle_service.write_vehicle_stats(results_store)
+            self.vehicle_service.write_route_grouped_vehicle_stats(False, results_store)
+            run_config = ResultsStore.get_run_config(self.vehicle_service.vehicles.values())
+            results_store.write_rtc_logs(run_config, self.rtc.get_logs())
+            if queue_data is not None:
+                results_store.write_tl_lane_queues(run_config, queue_data, tls_ids, tls_controlled_lanes)
+        finally:
+            results_store.close()
+
     def post_parallel_simulation(self, lock):
+        self.finalize_telemetry()
+        if GeneralSettings.results_store:
+            self.write_results()
+            self.remove_telemetry()
+            self.release_connection()
+            Checkpoint.clear(self.checkpoint_dir)
+            return
+
+        # Per vehicle outputs have unique file names, only shared route reports are written under the lock
+        self.vehicle_service.write_vehicle_stats()
+        self.remove_telemetry()
         lock.acquire()
         try:
-            self.vehicle_service.write_vehicle_stats()
             self.vehicle_service.write_route_grouped_vehicle_stats(False)
 
             """
             if len(self.vehicle_service.vehicles) == 1:
                 lane_tls, tls_ids, tls_controlled_lanes = self.get_lane_tls_data()
                 self.conn.close()
-                queue_data = self._get_lane_queue_data(lane_tls)
+                queue_data = self._get_lane_queue_data(self.queue_output_file, lane_tls)
                 vehicle = self.vehicle_service.vehicles.values()[0]
                 CsvExporter.parallel_export_tl_per_lane_queues(queue_data, tls_ids, tls_controlled_lanes,
                                                                vehicle.route_name, vehicle.preemption_mode.value(),
@@ -214,36 +375,74 @@ class SimulationRunner:
                                                                vehicle.reset_mode.value())
             else:
             """
-            self.conn.close()
+            self.release_connection()
+            Checkpoint.clear(self.checkpoint_dir)
         finally:
             lock.release()
 
+    def release_connection(self):
+        """ Pooled SUMO instance is returned to the pool with controller subscriptions removed, otherwise closed. """
+        if GeneralSettings.reuse_sumo:
+            from sumo_connection_pool import SumoConnectionPool
+            self.queue_sampler.close()
+            SumoConnectionPool.release(self.conn, self.sumo_cmd)
+        else:
+            self.conn.close()
+
     def post_simulation_processing(self):
-        self.vehicle_service.write_vehicle_stats()
-        CsvExporter.export_rtc_logs(self.rtc.logger)
-        self.vehicle_service.write_route_grouped_vehicle_stats(True)
+        self.finalize_telemetry()
         lane_tls, tls_ids, tls_controlled_lanes = self.get_lane_tls_data()
+        if not GeneralSettings.results_store:
+            self.vehicle_service.write_vehicle_stats()
+            CsvExporter.export_rtc_logs(self.rtc.get_logs())
+            self.vehicle_service.write_route_grouped_vehicle_stats(True)
         self.conn.close()
-        queue_data = self._get_lane_queue_data(lane_tls)
-        Plotter.plot_traffic_lights_per_lane_queues(queue_data, tls_ids, tls_controlled_lanes)
-        CsvExporter.export_traffic_lights_per_lane_queues(queue_data, tls_ids, tls_controlled_lanes)
+        if self.queue_sampler.lane_queues is not None:
+            queue_data = self.queue_sampler.lane_queues
+        else:
+            queue_data = self._get_lane_queue_data(self.queue_output_file, lane_tls, self.step)
+        PlotJobs.save_traffic_lights_per_lane_queues(queue_data, tls_ids, tls_controlled_lanes)
+        if GeneralSettings.results_store:
+            self.write_results(queue_data, tls_ids, tls_controlled_lanes)
+            from results_store import ResultsStore
+            ResultsStore.merge(GeneralSettings.results_dir)
+        else:
+            CsvExporter.export_traffic_lights_per_lane_queues(queue_data, tls_ids, tls_controlled_lanes)
+        self.remove_telemetry()
         sys.stdout.flush()
-        self._archive()
+        Checkpoint.clear(self.checkpoint_dir)
 
     @staticmethod
-    def _get_lane_queue_data(lane_tls):
-        queue_data = []
-        tree = ET.parse(GeneralSettings.debug_output_dir + '/queue.xml')
-        root = tree.getroot()
-        for i, data_element in enumerate(root):
-            tls_queue = defaultdict(lambda: defaultdict(float))
-            if data_element.findall('lanes'):
-                for lane_element in data_element.findall('lanes')[0].findall('lane'):
-                    lane_id = lane_element.attrib['id']
-                    if lane_id in lane_tls:
-                        for tl in lane_tls[lane_id]:
-                            tls_queue[tl][lane_id] = float(lane_element.attrib['queueing_length'])
-                queue_data.append(tls_queue)
+    def _get_lane_queue_data(queue_output_file, lane_tls, num_of_steps=0):
+        """
+        Streams SUMO queue output and keeps only lanes controlled by TLs. Elements are cleared as they are
+        parsed, so memory does not depend on the simulation length.
+        """
+        try:
+            import xml.etree.cElementTree as ET
+        except ImportError:
+            import xml.etree.ElementTree as ET
+        from lane_queue_data import LaneQueueData
+
+        queue_data = LaneQueueData(sorted(lane_tls.keys()), num_of_steps + 1)
+        lane_indexes = queue_data.lane_indexes
+        row = None
+        root = None
+        for event, element in ET.iterparse(queue_output_file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                elif element.tag == 'lanes':
+                    row = queue_data.add_row()
+            elif element.tag == 'lane':
+                index = lane_indexes.get(element.get('id'))
+                if index is not None:
+                    row[index] = float(element.get('queueing_length'))
+                element.clear()
+            elif element.tag == 'data':
+                row = None
+                element.clear()
+                root.clear()
         return queue_data
 
     @staticmethod
@@ -0,0 +1,53 @@
+import atexit
+import traci
+
+
+class SumoConnectionPool:
+    """
+    SUMO instances kept alive between simulations of the same worker process. Next scenario with the same SUMO
+    binary and configuration is loaded into an idle instance with traci.load (new route files and outputs),
+    so the SUMO process is not started and connected again for every simulation. Instances are closed when
+    the process exits (worker processes register close_all as multiprocessing finalizer).
+    """
+    idle = {}
+
+    @staticmethod
+    def acquire(sumo_cmd, label):
+        key = SumoConnectionPool._get_key(sumo_cmd)
+        while SumoConnectionPool.idle.get(key):
+            conn = SumoConnectionPool.idle[key].pop()
+            try:
+                conn.load(sumo_cmd[1:])
+                return conn
+            except Exception:
+                # Instance died, was closed after release or refused the scenario
+                SumoConnectionPool._close(conn)
+        traci.start(sumo_cmd, label=label)
+        return traci._connections[label]
+
+    @staticmethod
+    def release(conn, sumo_cmd):
+        """ Simulation state is discarded by the next load, previous outputs are closed by SUMO at that time. """
+        SumoConnectionPool.idle.setdefault(SumoConnectionPool._get_key(sumo_cmd), []).append(conn)
+
+    @staticmethod
+    def close_all():
+        for connections in SumoConnectionPool.idle.values():
+            for conn in connections:
+                SumoConnectionPool._close(conn)
+        SumoConnectionPool.idle.clear()
+
+    @staticmethod
+    def _get_key(sumo_cmd):
+        # binary, "-c", configuration file
+        return tuple(sumo_cmd[:3])
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+atexit.register(SumoConnectionPool.close_all)
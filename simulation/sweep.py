@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import itertools
+import collections
+from settings import PreemptionMode, ResetMode
+
+
+class Sweep:
+    """
+    Experiment sweep declared in the "sweep" object of the configuration. Every axis is a list of values and
+    the sweep is the cartesian product of all axes. Each cell is a configuration of a single simulation,
+    identified by the hash of that configuration. Hashes of finished cells are recorded, so an interrupted
+    or extended sweep runs only the missing cells.
+    """
+    # axis: default values, None means that value of the base configuration is kept
+    axes = collections.OrderedDict([
+        ('seed', None),
+        ('density', [0.8, 1, 1.2]),
+        ('route', None),
+        ('preemption_mode', None),
+        ('reset_mode', None),
+        ('preemption_range', None),
+        ('path_finder_algorithm', None)])
+
+    def __init__(self, json_data, record_file):
+        self.json_data = json_data
+        self.record_file = record_file
+        spec = json_data.get('sweep', {})
+
+        # Adaptive sweep runs iterations (seeds) of a cell until its route duration is precise enough
+        self.adaptive = spec.get('adaptive')
+        if self.adaptive is not None:
+            if 'seed' in spec:
+                raise ValueError("Seeds of adaptive sweep are set by its max_iterations")
+            if self.adaptive.get('min_iterations', 3) < 3:
+                raise ValueError("Adaptive sweep needs at least 3 iterations per cell")
+
+        num_of_iterations = self.adaptive.get('max_iterations', 10) if self.adaptive is not None \
+            else json_data['general'].get('num_of_iterations', 1)
+        defaults = {
+            'seed': range(0, num_of_iterations),
+            'route': [route['id'] for route in json_data['routes']],
+            'preemption_mode': [PreemptionMode.NONE.value],
+            'reset_mode': [ResetMode.STANDARD.value]}
+        sweep_modes = 'preemption_mode' in spec or 'reset_mode' in spec
+
+        self.axes = collections.OrderedDict()
+        for axis, default in Sweep.axes.iteritems():
+            if axis == 'preemption_mode' and not sweep_modes:
+                # Without explicit modes, (preemption mode, reset mode) pairs of vehicle modes are swept
+                self.axes['vehicle_mode'] = [(vm['preemption_mode'], vm['reset_mode'])
+                                             for vm in json_data['vehicle_modes']]
+            elif axis == 'reset_mode' and not sweep_modes:
+                continue
+            elif axis in spec:
+                self.axes[axis] = spec[axis]
+            elif default is not None:
+                self.axes[axis] = default
+            elif axis in defaults:
+                self.axes[axis] = defaults[axis]
+
+        for axis, values in self.axes.iteritems():
+            if not values:
+                raise ValueError("Sweep axis {} has no values".format(axis))
+
+        self.records = Sweep._load_records(record_file)
+        self.completed = set(self.records.keys())
+
+    def get_cells(self):
+        cells = []
+        for values in itertools.product(*self.axes.values()):
+            cell = collections.OrderedDict()
+            for axis, value in zip(self.axes.keys(), values):
+                if axis == 'vehicle_mode':
+                    cell['preemption_mode'], cell['reset_mode'] = value
+                else:
+                    cell[axis] = value
+            cells.append(cell)
+        return cells
+
+    def get_missing_cells(self):
+        return [cell for cell in self.get_cells() if self.get_cell_hash(cell) not in self.completed]
+
+    def get_cell_config(self, cell, route_files=None):
+        """ Configuration of a single simulation, only the swept parts of the base configuration are copied. """
+        config = {key: value for key, value in self.json_data.iteritems() if key != 'sweep'}
+        config['general'] = dict(self.json_data['general'])
+        config['general']['max_num_vehicles'] = self.json_data['general']['max_num_vehicles'] * cell['density']
+        config['general']['iteration'] = cell['seed']
+        if route_files is not None:
+            config['general']['route_files'] = route_files
+
+        config['vehicles'] = [dict(json_vehicle) for json_vehicle in self.json_data['vehicles']]
+        for json_vehicle in config['vehicles']:
+            json_vehicle['route'] = cell['route']
+            for key in ['preemption_mode', 'reset_mode', 'path_finder_algorithm']:
+                if key in cell:
+                    json_vehicle[key] = cell[key]
+
+        if 'preemption_range' in cell:
+            config['routes'] = [dict(route) for route in self.json_data['routes']]
+            for route in config['routes']:
+                route['preemption_range'] = cell['preemption_range']
+        return config
+
+    def get_cell_hash(self, cell):
+        """
+        Hash of the cell's own configuration. Parts which only define axes (vehicle modes, number of iterations,
+        other routes) are left out, so extending an axis keeps hashes of existing cells.
+        """
+        config = self.get_cell_config(cell)
+        config.pop('vehicle_modes', None)
+        config['general'] = {key: value for key, value in config['general'].iteritems() if key != 'num_of_iterations'}
+        config['routes'] = [route for route in config['routes'] if route['id'] == cell['route']]
+        return hashlib.sha1(json.dumps(config, sort_keys=True)).hexdigest()
+
+    @staticmethod
+    def get_cell_label(cell):
+        short_names = {'seed': 's', 'density': 'd', 'route': 'r', 'preemption_mode': 'pm', 'reset_mode': 'rm',
+                       'preemption_range': 'pr', 'path_finder_algorithm': 'pf'}
+        return "_".join("{}{}".format(short_names[axis], value) for axis, value in cell.iteritems())
+
+    @staticmethod
+    def get_config_key(cell):
+        """ Label of the cell without seed, all iterations of the same configuration have the same key. """
+        return Sweep.get_cell_label(collections.OrderedDict((axis, value) for axis, value in cell.iteritems()
+                                                            if axis != 'seed'))
+
+    # <editor-fold desc="Completed cells">
+
+    def mark_completed(self, cell, route_duration=None):
+        record = {'hash': self.get_cell_hash(cell), 'cell': cell, 'route_duration': route_duration}
+        with open(self.record_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        self.records[record['hash']] = record
+        self.completed.add(record['hash'])
+
+    def clear_completed(self):
+        if os.path.exists(self.record_file):
+            os.remove(self.record_file)
+        self.records = {}
+        self.completed = set()
+
+    @staticmethod
+    def _load_records(record_file):
+        records = {}
+        if not os.path.exists(record_file):
+            return records
+        with open(record_file) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Last line can be incomplete if the sweep was killed while writing it
+                    continue
+                records[record['hash']] = record
+        return records
+
+    # </editor-fold>
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import socket
+import base64
+import collections
+import SocketServer
+
+
+class SweepCoordinator:
+    """
+    Serves sweep jobs to workers on other machines (sweep_worker.py) over TCP and collects their results.
+    Every message is a single JSON line, a worker connects for each request:
+        get_job -> job (job_name, config, seed), wait (all remaining jobs are leased) or done
+        heartbeat (job_name) -> ok, sent periodically while the job runs
+        result (job_name, error, elapsed, route_duration, shards) -> ok, shards are base64 results store files
+    A job is leased to one worker. If the worker reports an error or stops sending heartbeats, the job is
+    queued again until it fails max_retries times. Result of a job, which is already finished, is ignored.
+    """
+    lease_timeout = 120
+    linger = 10
+
+    def __init__(self, jobs, results_dir, on_finished=None, max_retries=2):
+        """
+        jobs are (job_name, config, seed), on_finished(job_name, elapsed, error, route_duration) is called
+        for every job.
+        """
+        self.jobs = collections.OrderedDict((job[0], job) for job in jobs)
+        self.results_dir = results_dir
+        self.on_finished = on_finished
+        self.max_retries = max_retries
+
+        self.pending = collections.deque(self.jobs.keys())
+        self.leases = {}
+        self.attempts = collections.defaultdict(int)
+        self.finished = set()
+        self.failed = {}
+        self.workers = set()
+
+    def add_job(self, job):
+        self.jobs[job[0]] = job
+        self.pending.append(job[0])
+
+    def is_done(self):
+        return not self.pending and not self.leases
+
+    def serve(self, address):
+        """ Serves jobs until all are finished or failed, returns failed job names and their last errors. """
+        coordinator = self
+
+        class Handler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                self.connection.settimeout(60)
+                try:
+                    message = json.loads(self.rfile.readline())
+                    reply = coordinator.handle_message(message)
+                except (ValueError, KeyError, socket.error), e:
+                    reply = {'type': 'error', 'msg': str(e)}
+                self.wfile.write(json.dumps(reply) + '\n')
+
+        SocketServer.TCPServer.allow_reuse_address = True
+        server = SocketServer.TCPServer(address, Handler)
+        server.timeout = 1
+        try:
+            while not self.is_done():
+                server.handle_request()
+                self._expire_leases()
+            # Workers asking for more jobs are told that the sweep is done
+            linger_end = time.time() + SweepCoordinator.linger
+            while self.workers and time.time() < linger_end:
+                server.handle_request()
+        finally:
+            server.server_close()
+        return self.failed
+
+    def handle_message(self, message):
+        worker = message['worker']
+        if message['type'] == 'get_job':
+            if self.is_done():
+                self.workers.discard(worker)
+                return {'type': 'done'}
+            self.workers.add(worker)
+            if not self.pending:
+                return {'type': 'wait'}
+            job_name = self.pending.popleft()
+            self.leases[job_name] = (worker, time.time())
+            job_name, config, seed = self.jobs[job_name]
+            return {'type': 'job', 'job_name': job_name, 'config': config, 'seed': seed}
+        elif message['type'] == 'heartbeat':
+            if message['job_name'] in self.leases:
+                self.leases[message['job_name']] = (worker, time.time())
+            return {'type': 'ok'}
+        elif message['type'] == 'result':
+            self._add_result(worker, message)
+            return {'type': 'ok'}
+        raise ValueError("Unknown message type {}".format(message['type']))
+
+    def _add_result(self, worker, message):
+        job_name = message['job_name']
+        if job_name in self.finished or job_name in self.failed:
+            return
+        self.leases.pop(job_name, None)
+        if job_name in self.pending:
+            # Result of a lease, which expired, but the worker finished the job after all
+            self.pending.remove(job_name)
+        error = message.get('error')
+        if error is None:
+            for shard in message.get('shards', []):
+                with open(os.path.join(self.results_dir, os.path.basename(shard['name'])), 'wb') as f:
+                    f.write(base64.b64decode(shard['data']))
+            self.finished.add(job_name)
+        else:
+            print("Job {} failed on worker {}: {}".format(job_name, worker, error))
+            if not self._retry(job_name):
+                self.failed[job_name] = error
+            else:
+                return
+        if self.on_finished is not None:
+            self.on_finished(job_name, message.get('elapsed', 0), error, message.get('route_duration'))
+
+    def _retry(self, job_name):
+        self.attempts[job_name] += 1
+        if self.attempts[job_name] > self.max_retries:
+            return False
+        self.pending.append(job_name)
+        return True
+
+    def _expire_leases(self):
+        now = time.time()
+        for job_name, (worker, last_seen) in self.leases.items():
+            if now - last_seen > SweepCoordinator.lease_timeout:
+                print("Worker {} did not report job {} for {} s, job is released.".format(
+                    worker, job_name, SweepCoordinator.lease_timeout))
+                del self.leases[job_name]
+                self.workers.discard(worker)
+                if not self._retry(job_name):
+                    self.failed[job_name] = 'worker lost'
+                    if self.on_finished is not None:
+                        self.on_finished(job_name, now - last_seen, 'worker lost', None)
+
+    @staticmethod
+    def request(address, message, timeout=60):
+        """ Sends a message to the coordinator and returns its reply. """
+        sock = socket.create_connection(address, timeout)
+        try:
+            sock_file = sock.makefile('rwb')
+            sock_file.write(json.dumps(message) + '\n')
+            sock_file.flush()
+            reply = sock_file.readline()
+        finally:
+            sock.close()
+        if not reply:
+            raise socket.error("Connection closed by coordinator")
+        return json.loads(reply)
+
+    @staticmethod
+    def parse_address(address):
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
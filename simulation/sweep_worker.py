@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Runs sweep jobs served by parallel_runner.py --listen <host:port> on this machine:
+./sweep_worker.py -a <coordinator host:port> [-n <num of worker processes>]
+Data set (map, configuration) must be available under the same relative paths as on the coordinator.
+Trips are generated (or taken from the trip cache) locally, results are sent back to the coordinator.
+"""
+import os
+import glob
+import time
+import uuid
+import shutil
+import socket
+import base64
+import tempfile
+import threading
+import multiprocessing as mp
+from optparse import OptionParser
+
+from parallel_runner import prepare_trips, run_job, init_worker
+from results_store import ResultsStore
+from settings import TripSettings
+from sweep_coordinator import SweepCoordinator
+from trip_cache import TripCache
+
+
+def get_options():
+    opt_parser = OptionParser()
+    opt_parser.add_option("-a", "--address", action="store", type="string", dest="address",
+                          default="localhost:9500", help="address of the coordinator")
+    opt_parser.add_option("-n", "--processes", action="store", type="int", dest="processes", default=None,
+                          help="number of worker processes, number of CPUs by default")
+    opt_parser_options, _ = opt_parser.parse_args()
+    return opt_parser_options
+
+
+class Heartbeat(threading.Thread):
+    """ Reports the running job to the coordinator, so its lease does not expire. """
+    period = 10
+
+    def __init__(self, address, worker, job_name):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.address = address
+        self.message = {'type': 'heartbeat', 'worker': worker, 'job_name': job_name}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(Heartbeat.period):
+            try:
+                SweepCoordinator.request(self.address, self.message)
+            except socket.error:
+                continue
+
+
+def execute_job(job_name, config, seed):
+    """ Runs job with local trips and results directory, returns error, route duration and results store shards. """
+    results_dir = tempfile.mkdtemp(prefix='sweep_results_')
+    try:
+        trip_cache = TripCache('{}/trips'.format(config['general']['base_dir']), config['map']['map_location'])
+        route_files = prepare_trips(trip_cache, config['map']['map_location'], TripSettings(config['random_trips']),
+                                    [seed], 1)[seed]
+        config['general']['route_files'] = route_files
+        config['general']['results_dir'] = results_dir
+        _, elapsed, error, route_duration = run_job((job_name, config, None))
+        shards = []
+        if error is None:
+            for shard in glob.glob(os.path.join(results_dir, ResultsStore.shard_prefix + '*.sqlite')):
+                with open(shard, 'rb') as f:
+                    shards.append({'name': os.path.basename(shard), 'data': base64.b64encode(f.read())})
+        return error, route_duration, shards
+    except Exception, e:
+        return str(e), None, []
+    finally:
+        shutil.rmtree(results_dir, True)
+
+
+def work(address, max_connection_errors=30):
+    """ Pulls jobs until the coordinator is done or unreachable. """
+    worker = '{}-{}-{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+    init_worker(None)
+    connection_errors = 0
+    while connection_errors < max_connection_errors:
+        try:
+            reply = SweepCoordinator.request(address, {'type': 'get_job', 'worker': worker})
+        except socket.error:
+            connection_errors += 1
+            time.sleep(1)
+            continue
+        connection_errors = 0
+        if reply['type'] == 'done':
+            return
+        if reply['type'] != 'job':
+            time.sleep(2)
+            continue
+
+        start = time.time()
+        heartbeat = Heartbeat(address, worker, reply['job_name'])
+        heartbeat.start()
+        try:
+            error, route_duration, shards = execute_job(reply['job_name'], reply['config'], reply['seed'])
+        finally:
+            heartbeat.stopped.set()
+        result = {'type': 'result', 'worker': worker, 'job_name': reply['job_name'], 'error': error,
+                  'elapsed': time.time() - start, 'route_duration': route_duration, 'shards': shards}
+        for attempt in range(0, max_connection_errors):
+            try:
+                SweepCoordinator.request(address, result, timeout=300)
+                break
+            except socket.error:
+                time.sleep(1)
+
+
+def run_workers(address, processes=None):
+    processes = [mp.Process(target=work, args=(address,)) for _ in range(0, processes or mp.cpu_count())]
+    [p.start() for p in processes]
+    [p.join() for p in processes]
+
+
+if __name__ == "__main__":
+    options = get_options()
+    run_workers(SweepCoordinator.parse_address(options.address), options.processes)
@@ -0,0 +1,193 @@
+import os
+import sys
+import Queue
+import threading
+import cPickle as pickle
+import numpy as np
+
+
+class Telemetry:
+    """
+    Bounded-memory spill of per-step vehicle telemetry and RTC logs during the simulation. Rows are collected
+    in fixed-size chunks, which are appended to binary files by a background thread. Rows of a chunk are written
+    sorted by vehicle and row ranges of every vehicle are recorded, so after the run a vehicle series is read
+    through a memory map from its ranges only. RTC logs are streamed chunk by chunk. Error of the writer thread
+    is raised in the simulation thread on the next spill.
+    """
+    vehicle_dtype = np.dtype([('vehicle', np.int32), ('speed', np.float32), ('wait_time', np.float32),
+                              ('allowed_speed', np.float32)])
+    max_pending_chunks = 4
+
+    def __init__(self, directory, label, chunk_size, resume=False):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.vehicles_path = os.path.join(directory, label + '_vehicles.bin')
+        self.logs_path = os.path.join(directory, label + '_rtc_logs.bin')
+        self.chunk_size = chunk_size
+        self.vehicle_ids = []
+        self.chunk = np.empty(chunk_size, dtype=Telemetry.vehicle_dtype)
+        self.chunk_rows = 0
+        # vehicle index: [(first row, end row)] in the vehicles file, updated by the writer thread
+        self.vehicle_ranges = {}
+        self.rows_written = 0
+        self.error = None
+
+        # Append mode keeps writes at the end of file after truncation to checkpoint offsets on resume
+        self.vehicles_file = open(self.vehicles_path, 'ab')
+        self.logs_file = open(self.logs_path, 'ab')
+        if not resume:
+            os.ftruncate(self.vehicles_file.fileno(), 0)
+            os.ftruncate(self.logs_file.fileno(), 0)
+
+        # Bounded queue, simulation waits if the writer falls behind
+        self.queue = Queue.Queue(Telemetry.max_pending_chunks)
+        self.thread = threading.Thread(target=self._write_chunks)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.records = None
+
+    # <editor-fold desc="Writer">
+
+    def register(self, vehicle_id):
+        self.vehicle_ids.append(vehicle_id)
+        return len(self.vehicle_ids) - 1
+
+    def append(self, vehicle_index, speed, wait_time, allowed_speed):
+        self.chunk[self.chunk_rows] = (vehicle_index, speed, wait_time, allowed_speed)
+        self.chunk_rows += 1
+        if self.chunk_rows == self.chunk_size:
+            self._flush_vehicle_chunk()
+
+    def append_zeros(self, vehicle_index, num_of_steps):
+        for i in range(0, num_of_steps):
+            self.append(vehicle_index, 0, 0, 0)
+
+    def spill_logs(self, log_entries):
+        self._raise_writer_error()
+        self.queue.put((self.logs_file, log_entries))
+
+    def _flush_vehicle_chunk(self):
+        self._raise_writer_error()
+        if self.chunk_rows > 0:
+            self.queue.put((self.vehicles_file, self.chunk[:self.chunk_rows]))
+            self.chunk = np.empty(self.chunk_size, dtype=Telemetry.vehicle_dtype)
+            self.chunk_rows = 0
+
+    def _write_chunks(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    self._write_chunk(*item)
+            except Exception:
+                # Queue is still drained, so the simulation thread does not block on a full queue
+                self.error = sys.exc_info()
+            finally:
+                self.queue.task_done()
+
+    def _write_chunk(self, f, chunk):
+        if isinstance(chunk, np.ndarray):
+            chunk = self._index_vehicle_chunk(chunk)
+            chunk.tofile(f)
+        else:
+            pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+
+    def _index_vehicle_chunk(self, chunk):
+        """ Sorts chunk by vehicle, stable sort keeps rows of a vehicle in time order, and records their ranges. """
+        chunk = chunk[np.argsort(chunk['vehicle'], kind='mergesort')]
+        vehicles, starts = np.unique(chunk['vehicle'], return_index=True)
+        ends = np.r_[starts[1:], len(chunk)]
+        for vehicle, start, end in zip(vehicles.tolist(), (starts + self.rows_written).tolist(),
+                                       (ends + self.rows_written).tolist()):
+            self.vehicle_ranges.setdefault(vehicle, []).append((start, end))
+        self.rows_written += len(chunk)
+        return chunk
+
+    def _raise_writer_error(self):
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def _sync(self):
+        """ Waits until all collected rows are on disk. """
+        self._flush_vehicle_chunk()
+        self.queue.join()
+        self._raise_writer_error()
+
+    # </editor-fold>
+
+    # <editor-fold desc="Checkpoint">
+
+    def get_checkpoint_state(self):
+        self._sync()
+        return {'vehicle_ids': list(self.vehicle_ids),
+                'vehicle_ranges': {vehicle: list(ranges) for vehicle, ranges in self.vehicle_ranges.iteritems()},
+                'vehicles_size': os.fstat(self.vehicles_file.fileno()).st_size,
+                'logs_size': os.fstat(self.logs_file.fileno()).st_size}
+
+    def restore_checkpoint_state(self, state):
+        """ Drops data written after the checkpoint. If state is not set, files are emptied. """
+        self._sync()
+        if state is not None:
+            self.vehicle_ids = state['vehicle_ids']
+        self.vehicle_ranges = state['vehicle_ranges'] if state else {}
+        self.rows_written = state['vehicles_size'] / Telemetry.vehicle_dtype.itemsize if state else 0
+        os.ftruncate(self.vehicles_file.fileno(), state['vehicles_size'] if state else 0)
+        os.ftruncate(self.logs_file.fileno(), state['logs_size'] if state else 0)
+
+    # </editor-fold>
+
+    # <editor-fold desc="Reader">
+
+    def finalize(self):
+        """ Writes remaining rows, stops the writer thread and maps vehicle telemetry for reading. """
+        if self.records is not None:
+            return
+        try:
+            self._sync()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.vehicles_file.close()
+            self.logs_file.close()
+
+        if os.path.getsize(self.vehicles_path) > 0:
+            self.records = np.memmap(self.vehicles_path, dtype=Telemetry.vehicle_dtype, mode='r')
+        else:
+            self.records = np.zeros(0, dtype=Telemetry.vehicle_dtype)
+
+    def remove_files(self):
+        """ Deletes spill files, when their contents are written into results. """
+        self.finalize()
+        self.records = np.zeros(0, dtype=Telemetry.vehicle_dtype)
+        self.vehicle_ranges = {}
+        for path in (self.vehicles_path, self.logs_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get_vehicle_series(self, vehicle_index):
+        """ Returns speed, wait time and allowed speed series of the vehicle. """
+        ranges = self.vehicle_ranges.get(vehicle_index)
+        if ranges:
+            rows = np.concatenate([self.records[start:end] for start, end in ranges])
+        else:
+            rows = self.records[:0]
+        return rows['speed'], rows['wait_time'], rows['allowed_speed']
+
+    def get_logs(self, log_tail):
+        """ Spilled RTC log entries followed by entries which are still in memory. """
+        with open(self.logs_path, 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    break
+                for entry in chunk:
+                    yield entry
+        for entry in log_tail:
+            yield entry
+
+    # </editor-fold>
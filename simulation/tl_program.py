@@ -0,0 +1,52 @@
+import copy
+from collections import namedtuple
+
+
+class TLProgram(namedtuple('TLProgram', ['program_id', 'phase_states', 'durations', 'cycle_offsets',
+                                         'cycle_duration', 'logic'])):
+    """
+    Immutable, precompiled default program of a TL. Phase states and durations (in ms) are stored in tuples
+    together with the cumulative cycle offset of every phase, so it can be shared and read without copying.
+    The original SUMO logic object must never be modified, modified programs are built with build_logic.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def from_logic(logic):
+        phase_states = tuple(phase._phaseDef for phase in logic._phases)
+        durations = tuple(phase._duration for phase in logic._phases)
+        cycle_offsets = []
+        offset = 0
+        for duration in durations:
+            cycle_offsets.append(offset)
+            offset += duration
+        return TLProgram(logic._subID, phase_states, durations, tuple(cycle_offsets), offset, logic)
+
+    def find_phase_index(self, first_index, last_index):
+        """ Returns index of the first phase with green signals on all links between first and last index. """
+        green = 'g' * (last_index - first_index + 1)
+        for index, state in enumerate(self.phase_states):
+            if state[first_index:(last_index + 1)].lower() == green:
+                return index
+        return None
+
+    def time_to_phase(self, curr_phase_index, target_phase_index):
+        """ Duration of phases from current (including) to target phase (excluding), whole cycle if they match. """
+        if curr_phase_index == target_phase_index:
+            return self.cycle_duration
+        return (self.cycle_offsets[target_phase_index] - self.cycle_offsets[curr_phase_index]) % self.cycle_duration
+
+    def pending_phase_indexes(self, curr_phase_index, target_phase_index):
+        if curr_phase_index >= target_phase_index:
+            return range(curr_phase_index, len(self.phase_states)) + range(0, target_phase_index)
+        return range(curr_phase_index, target_phase_index)
+
+    def build_logic(self, durations=None, states=None):
+        """ Builds new SUMO logic object with overridden phase durations and states (phase index: value). """
+        logic = copy.copy(self.logic)
+        logic._phases = [copy.copy(phase) for phase in self.logic._phases]
+        for index, duration in (durations or {}).iteritems():
+            logic._phases[index]._duration = duration
+        for index, state in (states or {}).iteritems():
+            logic._phases[index]._phaseDef = state
+        return logic
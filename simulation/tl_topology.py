@@ -0,0 +1,68 @@
+class TLTopology:
+    """
+    Static topology of all TLs in the network. Controlled lanes and links never change during a run,
+    so they are queried once at startup and shared by the road traffic control and all vehicles.
+    """
+    def __init__(self, traci_conn):
+        self.controlled_lanes = {}
+        self.controlled_lane_sets = {}
+        self.controlled_links = {}
+        self.lane_tls = {}
+        self.incoming_lanes = {}
+        self.incoming_index_ranges = {}
+        self.outgoing_lanes = {}
+
+        for tl_id in traci_conn.trafficlight.getIDList():
+            self._add_tl(tl_id, tuple(traci_conn.trafficlight.getControlledLanes(tl_id)),
+                         tuple(traci_conn.trafficlight.getControlledLinks(tl_id)))
+
+    def _add_tl(self, tl_id, controlled_lanes, controlled_links):
+        self.controlled_lanes[tl_id] = controlled_lanes
+        self.controlled_lane_sets[tl_id] = frozenset(controlled_lanes)
+        self.controlled_links[tl_id] = controlled_links
+
+        # edge: incoming lanes in order of controlled links, edge: (first, last) controlled link index
+        incoming_lanes = {}
+        index_ranges = {}
+        for index, lane_id in enumerate(controlled_lanes):
+            edge_id = TLTopology.lane_edge(lane_id)
+            if edge_id not in incoming_lanes:
+                incoming_lanes[edge_id] = []
+                index_ranges[edge_id] = (index, index)
+            if lane_id not in incoming_lanes[edge_id]:
+                incoming_lanes[edge_id].append(lane_id)
+            index_ranges[edge_id] = (index_ranges[edge_id][0], index)
+        self.incoming_lanes[tl_id] = {edge_id: tuple(lanes) for edge_id, lanes in incoming_lanes.iteritems()}
+        self.incoming_index_ranges[tl_id] = index_ranges
+
+        outgoing_lanes = {}
+        for links in controlled_links:
+            for link in links:
+                out_lane = link[1]
+                edge_id = TLTopology.lane_edge(out_lane)
+                if edge_id not in outgoing_lanes:
+                    outgoing_lanes[edge_id] = []
+                if out_lane not in outgoing_lanes[edge_id]:
+                    outgoing_lanes[edge_id].append(out_lane)
+        self.outgoing_lanes[tl_id] = {edge_id: tuple(lanes) for edge_id, lanes in outgoing_lanes.iteritems()}
+
+        for lane_id in self.controlled_lane_sets[tl_id]:
+            if lane_id in self.lane_tls:
+                self.lane_tls[lane_id].append(tl_id)
+            else:
+                self.lane_tls[lane_id] = [tl_id]
+
+    def get_incoming_lanes(self, tl_id, edge_id):
+        return self.incoming_lanes[tl_id].get(edge_id, ())
+
+    def get_incoming_index_range(self, tl_id, edge_id):
+        """ (first, last) controlled link index of the incoming edge. """
+        return self.incoming_index_ranges[tl_id][edge_id]
+
+    def get_outgoing_lane(self, tl_id, edge_id):
+        lanes = self.outgoing_lanes[tl_id].get(edge_id, ())
+        return lanes[0] if lanes else None
+
+    @staticmethod
+    def lane_edge(lane_id):
+        return lane_id.rsplit('_', 1)[0]
@@ -0,0 +1,53 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+
+
+class TripCache:
+    """
+    Generated background traffic of a single vehicle class, stored by (generator, net hash, vehicle class, count,
+    fringe factor, seed, end). Trips depend only on these, so repeated sweeps, sweeps with additional modes and
+    all jobs with the same seed reuse identical routes. Entries are generated into a temporary directory and
+    renamed when complete, so an interrupted generation is never used.
+    """
+    def __init__(self, cache_dir, net_file):
+        self.cache_dir = cache_dir
+        self.net_hash = TripCache.get_file_hash(net_file)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def get_file_hash(file_name):
+        sha = hashlib.sha1()
+        with open(file_name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def get_entry_dir(self, generator, vehicle, count, fringe_factor, seed, end, length_weight):
+        key = json.dumps([generator, self.net_hash, vehicle, count, fringe_factor, seed, end, length_weight])
+        return os.path.join(self.cache_dir, '{}_{}'.format(vehicle, hashlib.sha1(key).hexdigest()[:16]))
+
+    @staticmethod
+    def get_route_file(entry_dir, vehicle):
+        return os.path.abspath(os.path.join(entry_dir, '{}.rou.xml'.format(vehicle)))
+
+    @staticmethod
+    def is_cached(entry_dir):
+        return os.path.isdir(entry_dir)
+
+    @staticmethod
+    def get_tmp_dir(entry_dir):
+        tmp_dir = '{}.tmp_{}'.format(entry_dir, uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        return tmp_dir
+
+    @staticmethod
+    def commit(tmp_dir, entry_dir):
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Same entry was generated by another sweep in the meantime
+            shutil.rmtree(tmp_dir, True)
@@ -0,0 +1,174 @@
+import io
+import numpy as np
+
+
+class TripGenerator:
+    """
+    Random trips of background traffic, generated from an already loaded network (replacement for randomTrips.py,
+    which parses the network again for every call). Origins and destinations are drawn with NumPy, uniformly
+    (or with edge length as weight, as randomTrips --length) and fringe edges weighted by the fringe factor.
+    Origins are edges, from which the largest strongly connected component of the vehicle class is reachable,
+    destinations are edges reachable from it, so every trip has a route (randomTrips --validate).
+    """
+    # vehicle class: trip id prefix, min distance, max distance, vType attributes
+    vehicle_parameters = {
+        'passenger': ('veh', 300., None, ' speedDev="0.1"'),
+        'taxi': ('taxi', 600., None, ' speedDev="0.1"'),
+        'bus': ('bus', 600., None, ''),
+        'motorcycle': ('moto', 0., 1200., ' speedDev="0.1"')
+    }
+    max_draw_rounds = 100
+
+    def __init__(self, network):
+        self.network = network
+        self.edges = {}
+        self.edge_lengths = None
+
+    def get_edge_lengths(self):
+        """ Total length of lanes, which allow the vehicle class. """
+        if self.edge_lengths is not None:
+            return self.edge_lengths
+        lengths = {}
+        for vehicle in TripGenerator.vehicle_parameters.keys():
+            length = 0.
+            for edge in self.network.getEdges():
+                if edge.allows(vehicle):
+                    length += edge.getLaneNumber() * edge.getLength()
+            lengths[vehicle] = length
+        self.edge_lengths = lengths
+        return lengths
+
+    def write_trips(self, trips_file, vehicle, count, fringe_factor, end, seed, lane_length, length_weight=False):
+        """ Trips depart with period, which gives count vehicles per hour and lane kilometer (as randomTrips -p). """
+        prefix, min_distance, max_distance, vtype_attributes = TripGenerator.vehicle_parameters[vehicle]
+        period = 3600 / (lane_length / 1000) / count
+        departs = np.arange(0., float(end), period)
+
+        origins, destinations = self._get_edges(vehicle, fringe_factor, length_weight)
+        random_state = np.random.RandomState(seed)
+        from_indexes, to_indexes = TripGenerator._draw(random_state, len(departs), origins, destinations,
+                                                       min_distance, max_distance)
+
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>\n<routes>\n',
+                 '    <vType id="{0}" vClass="{0}"{1}/>\n'.format(vehicle, vtype_attributes)]
+        lines += ['    <trip id="{}{}" type="{}" depart="{:.2f}" from="{}" to="{}" departLane="best"/>\n'.format(
+            prefix, i, vehicle, depart, origins[0][from_index], destinations[0][to_index])
+            for i, (depart, from_index, to_index) in enumerate(zip(departs, from_indexes, to_indexes))]
+        lines.append('</routes>\n')
+        with io.open(trips_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            f.write(u''.join(lines))
+
+    @staticmethod
+    def _draw(random_state, num_of_trips, origins, destinations, min_distance, max_distance):
+        """ Draws origin and destination indexes in batches, pairs out of the distance range are redrawn. """
+        _, from_codes, from_weights, from_coords = origins
+        _, to_codes, to_weights, to_coords = destinations
+        from_indexes = []
+        to_indexes = []
+        found = 0
+        for _ in range(0, TripGenerator.max_draw_rounds):
+            if found >= num_of_trips:
+                break
+            batch_size = max(2 * (num_of_trips - found), 64)
+            from_batch = random_state.choice(len(from_weights), batch_size, p=from_weights)
+            to_batch = random_state.choice(len(to_weights), batch_size, p=to_weights)
+            distances = np.hypot(*(to_coords[to_batch] - from_coords[from_batch]).T)
+            valid = (from_codes[from_batch] != to_codes[to_batch]) & (distances >= min_distance)
+            if max_distance is not None:
+                valid &= distances <= max_distance
+            from_indexes.append(from_batch[valid])
+            to_indexes.append(to_batch[valid])
+            found += np.count_nonzero(valid)
+        if found < num_of_trips:
+            raise ValueError("Could not draw {} trips in the distance range".format(num_of_trips))
+        return np.concatenate(from_indexes)[:num_of_trips], np.concatenate(to_indexes)[:num_of_trips]
+
+    def _get_edges(self, vehicle, fringe_factor, length_weight):
+        """ Origins and destinations as (edge ids, edge codes, normalized weights, coordinates). """
+        key = (vehicle, fringe_factor, length_weight)
+        if key not in self.edges:
+            edges = sorted([edge for edge in self.network.getEdges() if edge.allows(vehicle)], key=lambda e: e.getID())
+            codes = {edge: i for i, edge in enumerate(edges)}
+            outgoing = {edge: [e for e in edge.getOutgoing() if e in codes] for edge in edges}
+            incoming = {edge: [] for edge in edges}
+            for edge, next_edges in outgoing.iteritems():
+                for next_edge in next_edges:
+                    incoming[next_edge].append(edge)
+
+            component = TripGenerator._get_largest_component(edges, outgoing, incoming)
+            origins = sorted(TripGenerator._get_reachable(component, incoming), key=lambda e: e.getID())
+            destinations = sorted(TripGenerator._get_reachable(component, outgoing), key=lambda e: e.getID())
+            self.edges[key] = (
+                TripGenerator._get_candidates(origins, codes, incoming, fringe_factor, length_weight,
+                                              lambda e: e.getFromNode()),
+                TripGenerator._get_candidates(destinations, codes, outgoing, fringe_factor, length_weight,
+                                              lambda e: e.getToNode()))
+        return self.edges[key]
+
+    @staticmethod
+    def _get_candidates(edges, codes, neighbours, fringe_factor, length_weight, get_node):
+        """ Fringe edges (without neighbours in the direction) are weighted by the fringe factor, optionally length. """
+        weights = np.array([edge.getLength() if length_weight else 1. for edge in edges]) * \
+            np.array([fringe_factor if TripGenerator._is_fringe(edge, neighbours[edge]) else 1. for edge in edges])
+        coords = np.array([get_node(edge).getCoord()[:2] for edge in edges], dtype=float)
+        return ([edge.getID() for edge in edges], np.array([codes[edge] for edge in edges]), weights / weights.sum(),
+                coords)
+
+    @staticmethod
+    def _is_fringe(edge, neighbours):
+        """ Edge on the border of the network, its only neighbours are turnarounds (as sumolib is_fringe). """
+        return all(neighbour.getFromNode() == edge.getToNode() and neighbour.getToNode() == edge.getFromNode()
+                   for neighbour in neighbours)
+
+    @staticmethod
+    def _get_reachable(edges, neighbours):
+        """ Edges reachable from the edges through neighbours, including the edges. """
+        reachable = set(edges)
+        stack = list(edges)
+        while stack:
+            for neighbour in neighbours[stack.pop()]:
+                if neighbour not in reachable:
+                    reachable.add(neighbour)
+                    stack.append(neighbour)
+        return reachable
+
+    @staticmethod
+    def _get_largest_component(edges, outgoing, incoming):
+        """ Largest strongly connected component of the edge graph (Kosaraju). """
+        # Order of edges by DFS finish time
+        order = []
+        visited = set()
+        for root in edges:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(outgoing[root]))]
+            while stack:
+                edge, next_edges = stack[-1]
+                for next_edge in next_edges:
+                    if next_edge not in visited:
+                        visited.add(next_edge)
+                        stack.append((next_edge, iter(outgoing[next_edge])))
+                        break
+                else:
+                    stack.pop()
+                    order.append(edge)
+
+        # Components on reversed graph in reverse finish order
+        largest = []
+        assigned = set()
+        for root in reversed(order):
+            if root in assigned:
+                continue
+            component = [root]
+            assigned.add(root)
+            stack = [root]
+            while stack:
+                for previous_edge in incoming[stack.pop()]:
+                    if previous_edge not in assigned:
+                        assigned.add(previous_edge)
+                        component.append(previous_edge)
+                        stack.append(previous_edge)
+            if len(component) > len(largest):
+                largest = component
+        return largest
@@ -1,19 +1,30 @@
-import traci
 import time
+import numpy as np
 from settings import GeneralSettings
 from csv_exporter import CsvExporter
-from plotter import Plotter
+from plot_jobs import PlotJobs
+from growable_buffer import GrowableBuffer
 
 
-class Stats:
+class Stats(object):
+    __slots__ = ('vehicle_id', 'visited_intersections', 'checkpoints', 'start_finish_time_steps', 'speed',
+                 'allowed_speed', 'wait_time', 'tls_on_the_route', 'tls_queues', 'tls_queue_state',
+                 'telemetry_index')
+    # If set, per-step series are spilled to disk instead of kept in memory
+    telemetry = None
+
     def __init__(self, vehicle_id):
         self.vehicle_id = vehicle_id
+        self.telemetry_index = Stats.telemetry.register(vehicle_id) if Stats.telemetry is not None else None
         self.visited_intersections = []
         self.checkpoints = []
         self.start_finish_time_steps = []
-        self.speed = []
-        self.allowed_speed = []
-        self.wait_time = []
+        if self.telemetry_index is None:
+            self.speed = GrowableBuffer(np.float32)
+            self.allowed_speed = GrowableBuffer(np.float32)
+            self.wait_time = GrowableBuffer(np.float32)
+        else:
+            self.speed = self.allowed_speed = self.wait_time = None
         self.tls_on_the_route = []
         self.tls_queues = {}
         self.tls_queue_state = {}
@@ -28,46 +39,68 @@ class Stats:
     def add_start_finish_checkpoint(self, time_step):
         self.start_finish_time_steps.append(time_step)
 
+    def get_route_duration(self):
+        """ Number of steps of finished trips (there and back for two-way routes), None if no trip is finished. """
+        steps = self.start_finish_time_steps
+        if len(steps) < 2:
+            return None
+        return sum(steps[i + 1] - steps[i] for i in range(0, len(steps) - 1, 2))
+
     def add_wait_gap(self, num_of_steps):
-        self.speed.extend([0 for i in range(0, num_of_steps)])
-        self.allowed_speed.extend([0 for i in range(0, num_of_steps)])
-        self.wait_time.extend([0 for i in range(0, num_of_steps)])
+        if self.telemetry_index is not None:
+            Stats.telemetry.append_zeros(self.telemetry_index, num_of_steps)
+            return
+        self.speed.extend_zeros(num_of_steps)
+        self.allowed_speed.extend_zeros(num_of_steps)
+        self.wait_time.extend_zeros(num_of_steps)
+
+    def get_series(self):
+        """ Returns speed, wait time and allowed speed series. """
+        if self.telemetry_index is not None:
+            return Stats.telemetry.get_vehicle_series(self.telemetry_index)
+        return self.speed.view(), self.wait_time.view(), self.allowed_speed.view()
 
-    def update(self, speed, waiting_time, allowed_speed, is_one_way, traci_conn):
-        try:
+    def get_monitored_tls(self):
+        return self.tls_queue_state.keys()
+
+    def update(self, speed, waiting_time, allowed_speed, is_one_way, tl_queues):
+        """ tl_queues are total halting numbers of monitored TLs, sampled once per step for all vehicles. """
+        if self.telemetry_index is not None:
+            Stats.telemetry.append(self.telemetry_index, speed if speed > 0 else 0, waiting_time, allowed_speed)
+        else:
             self.speed.append(speed if speed > 0 else 0)
             self.wait_time.append(waiting_time)
             self.allowed_speed.append(allowed_speed)
 
-            """ Update TLS queue stats """
-            for tl_id in self.tls_queue_state.keys():
-                lanes = set(traci_conn.trafficlights.getControlledLanes(tl_id))
-                total_halting_num = sum([traci_conn.lane.getLastStepHaltingNumber(lane) for lane in lanes])
-                dict_key = str(int(is_one_way)) + "__" + tl_id
-
-                if dict_key in self.tls_queues:
-                    self.tls_queues[dict_key].append(total_halting_num)
-                else:
-                    self.tls_queues[dict_key] = [total_halting_num]
-
-                # Update counter
-                counter = self.tls_queue_state[tl_id]
-                if counter == 0:
-                    del self.tls_queue_state[tl_id]
-                else:
-                    self.tls_queue_state[tl_id] = self.tls_queue_state[tl_id] - 1
-
-        except traci.exceptions.TraCIException:
-            self.speed.append(0)
-            self.wait_time.append(0)
-            self.allowed_speed.append(0)
+        """ Update TLS queue stats """
+        for tl_id in self.tls_queue_state.keys():
+            dict_key = str(int(is_one_way)) + "__" + tl_id
+            if dict_key not in self.tls_queues:
+                self.tls_queues[dict_key] = GrowableBuffer(np.int32, 64)
+            self.tls_queues[dict_key].append(tl_queues[tl_id])
+
+            # Update counter
+            counter = self.tls_queue_state[tl_id]
+            if counter == 0:
+                del self.tls_queue_state[tl_id]
+            else:
+                self.tls_queue_state[tl_id] = self.tls_queue_state[tl_id] - 1
 
     def plot_stats(self):
-        Plotter.plot_vehicle_stats(self.speed, self.wait_time, self.allowed_speed, self.vehicle_id)
+        speed, wait_time, allowed_speed = self.get_series()
+        PlotJobs.save_vehicle_stats(speed, wait_time, allowed_speed, self.vehicle_id)
 
     def write_csv_stats(self, vehicle):
-        CsvExporter.export_vehicle_stats(self.speed, self.wait_time, self.allowed_speed, vehicle)
-        CsvExporter.export_vehicle_route_queues(vehicle, self.tls_queues)
+        speed, wait_time, allowed_speed = self.get_series()
+        CsvExporter.export_vehicle_stats(speed, wait_time, allowed_speed, vehicle)
+        CsvExporter.export_vehicle_route_queues(vehicle, {tl_key: tl_data.view()
+                                                          for tl_key, tl_data in self.tls_queues.iteritems()})
+
+    def write_results(self, results_store, vehicle):
+        speed, wait_time, allowed_speed = self.get_series()
+        results_store.write_vehicle_stats(speed, wait_time, allowed_speed, vehicle)
+        results_store.write_vehicle_route_queues(vehicle, {tl_key: tl_data.view()
+                                                           for tl_key, tl_data in self.tls_queues.iteritems()})
 
     def print_stats(self, vehicle):
         with open("{}/stats_{}_{}.txt".format(GeneralSettings.debug_output_dir, time.time(), self.vehicle_id),
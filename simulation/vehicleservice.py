@@ -1,4 +1,5 @@
 import json
+import collections
 from intervention_vehicle import InterventionVehicle
 from path_finder import PathFinder
 from csv_exporter import CsvExporter
@@ -6,11 +7,23 @@ from settings import PreemptionMode
 
 
 class VehicleService:
-    def __init__(self, json_data, traci_conn, rtc_conn, vehicle_mode_id=None):
+    def __init__(self, json_data, traci_conn, rtc_conn, vehicle_mode_id=None, is_restored=False):
+        """ If is_restored is set, vehicles with their routes are restored from checkpoint instead of created. """
         self.vehicles = {}
+        self.traci_conn = traci_conn
+        self.rtc_conn = rtc_conn
+
+        # State partitions, updated on vehicle state transitions
+        self.insertion_queue = {}
+        self.active_preempting = collections.OrderedDict()
+        self.active_passive = collections.OrderedDict()
+        self.finished = collections.OrderedDict()
+        self.route_vehicles = collections.defaultdict(list)
 
         """Parse options and init simulation objects"""
         self.routes = {r['id']: r for r in json_data['routes']}
+        if is_restored:
+            return
 
         if vehicle_mode_id is not None:
             vehicle_modes = [vm for vm in json_data['vehicle_modes'] if vm['id'] == vehicle_mode_id][0]
@@ -33,7 +46,7 @@ class VehicleService:
                     """ Pre-processing - calculate vehicles path """
                     route = PathFinder.get_route(vehicle)
                     vehicle.set_route(route)
-                    self.vehicles[vehicle.id] = vehicle
+                    self.add_vehicle(vehicle)
                     delay += json_vehicle['repeat_period']
             else:
                 vehicle = InterventionVehicle(traci_conn,
@@ -50,22 +63,58 @@ class VehicleService:
                 """ Pre-processing - calculate vehicles path """
                 route = PathFinder.get_route(vehicle)
                 vehicle.set_route(route)
-                self.vehicles[vehicle.id] = vehicle
+                self.add_vehicle(vehicle)
+
+    def add_vehicle(self, vehicle):
+        self.vehicles[vehicle.id] = vehicle
+        self.route_vehicles[vehicle.route_name].append(vehicle)
+        self.enqueue(vehicle.id, vehicle.start_delay)
 
     def get_vehicle(self, vehicle_id):
         return self.vehicles[vehicle_id]
 
+    # <editor-fold desc="State transitions">
+
+    def enqueue(self, vehicle_id, step):
+        if step in self.insertion_queue:
+            self.insertion_queue[step].append(vehicle_id)
+        else:
+            self.insertion_queue[step] = [vehicle_id]
+
+    def pop_vehicles_to_insert(self, step):
+        return [self.vehicles[vehicle_id] for vehicle_id in self.insertion_queue.pop(step, [])]
+
+    def get_queued_vehicles(self):
+        return [self.vehicles[vehicle_id] for vehicle_ids in self.insertion_queue.values() for vehicle_id in vehicle_ids]
+
+    def activate(self, vehicle):
+        vehicle.is_active = True
+        if vehicle.preemption_mode is PreemptionMode.NONE:
+            self.active_passive[vehicle.id] = vehicle
+        else:
+            self.active_preempting[vehicle.id] = vehicle
+
+    def deactivate(self, vehicle, is_finished):
+        vehicle.is_active = False
+        vehicle.is_finished = is_finished
+        self.active_passive.pop(vehicle.id, None)
+        self.active_preempting.pop(vehicle.id, None)
+        if is_finished:
+            self.finished[vehicle.id] = vehicle
+
+    # </editor-fold>
+
     def get_vehicles_to_preempt(self):
-        return [v for v in self.vehicles.values() if v.is_active and v.preemption_mode is not PreemptionMode.NONE]
+        return self.active_preempting.values()
 
     def get_none_preemption_vehicles(self):
-        return [v for v in self.vehicles.values() if v.is_active and v.preemption_mode is PreemptionMode.NONE]
+        return self.active_passive.values()
 
     def get_active_vehicles(self):
-        return [v for v in self.vehicles.values() if v.is_active]
+        return self.active_passive.values() + self.active_preempting.values()
 
     def is_any_non_finished_vehicle(self):
-        return not all([v.is_finished for v in self.vehicles.values()])
+        return len(self.finished) < len(self.vehicles)
 
     def set_return_route(self, vehicle_id, step):
         # Get current vehicle and remove it from list
@@ -77,13 +126,37 @@ class VehicleService:
         route = PathFinder.get_route(vehicle)
         vehicle.set_route(route)
 
-    def write_vehicle_stats(self):
+    def get_checkpoint_state(self):
+        return {'vehicles': self.vehicles, 'insertion_queue': self.insertion_queue}
+
+    def restore_checkpoint_state(self, state):
+        self.vehicles = state['vehicles']
+        self.insertion_queue = state['insertion_queue']
+        self.active_preempting.clear()
+        self.active_passive.clear()
+        self.finished.clear()
+        self.route_vehicles.clear()
+        for vehicle in self.vehicles.values():
+            vehicle.set_connections(self.traci_conn, self.rtc_conn)
+            self.route_vehicles[vehicle.route_name].append(vehicle)
+            if vehicle.is_active:
+                self.activate(vehicle)
+            elif vehicle.is_finished:
+                self.finished[vehicle.id] = vehicle
+
+    def write_vehicle_stats(self, results_store=None):
         for vehicle in self.vehicles.values():
             vehicle.stats.print_stats(vehicle)
             vehicle.stats.plot_stats()
-            vehicle.stats.write_csv_stats(vehicle)
+            if results_store is not None:
+                vehicle.stats.write_results(results_store, vehicle)
+            else:
+                vehicle.stats.write_csv_stats(vehicle)
 
-    def write_route_grouped_vehicle_stats(self, append_header):
+    def write_route_grouped_vehicle_stats(self, append_header, results_store=None):
         for route_data in self.routes.values():
-            vehicles = [vehicle for vehicle in self.vehicles.values() if vehicle.route_name == route_data['id']]
-            CsvExporter.export_route_grouped_vehicles_report(vehicles, route_data, append_header)
+            vehicles = self.route_vehicles.get(route_data['id'], [])
+            if results_store is not None:
+                results_store.write_route_trips(vehicles)
+            else:
+                CsvExporter.export_route_grouped_vehicles_report(vehicles, route_data, append_header)
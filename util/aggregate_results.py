@@ -0,0 +1,249 @@
+#!/usr/bin/python
+"""
+Trip durations of intervention vehicles after a sweep, grouped by configuration (route, density, preemption range,
+preemption mode, reset mode). Reads route CSV files of the statistics directory (repeated headers and malformed
+rows are skipped) or route_trips table of the results database. Rows are streamed in batches into integer coded
+columns, grouping, percentiles and bootstrap confidence intervals are computed with NumPy.
+Trip duration of a two-way route includes the return trip, trips whose return trip did not finish are skipped.
+Every mode is compared with PreemptionMode.NONE of the same route, density and preemption range:
+relative change of the mean trip duration with bootstrap confidence interval.
+"""
+import os
+import re
+import sys
+import glob
+import getopt
+import sqlite3
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulation'))
+from settings import PreemptionMode, ResetMode
+
+key_columns = ['route', 'density', 'preemption_range', 'preemption_mode', 'reset_mode']
+percentiles = [50, 90, 95]
+bootstrap_cells = 10 ** 7
+
+
+class Columns:
+    """
+    Rows are added in batches. Configuration values of a batch are coded to integers with np.unique,
+    so memory per row is a few machine words and Python work per row is only parsing.
+    """
+    batch_size = 100000
+
+    def __init__(self):
+        self.codes = [{} for _ in key_columns]
+        self.values = [[] for _ in key_columns]
+        self.keys = []
+        self.durations = []
+
+    def add_rows(self, rows):
+        if not rows:
+            return
+        columns = zip(*rows)
+        batch_keys = np.empty((len(rows), len(key_columns)), dtype=np.int32)
+        for i in range(0, len(key_columns)):
+            unique_values, inverse = np.unique(np.array(columns[i]), return_inverse=True)
+            codes = np.array([self._get_code(i, value) for value in unique_values.tolist()], dtype=np.int32)
+            batch_keys[:, i] = codes[inverse]
+        self.keys.append(batch_keys)
+        self.durations.append(np.array(columns[-1], dtype=np.float64))
+
+    def _get_code(self, column, value):
+        code = self.codes[column].get(value)
+        if code is None:
+            code = self.codes[column][value] = len(self.values[column])
+            self.values[column].append(value)
+        return code
+
+    def get_arrays(self):
+        if not self.keys:
+            return np.zeros((0, len(key_columns)), dtype=np.int32), np.zeros(0)
+        return np.concatenate(self.keys), np.concatenate(self.durations)
+
+
+def get_num_of_columns(file_name):
+    """ 8 columns if the route is two-way (header or any trip with return trip), otherwise 5. """
+    with open(file_name) as f:
+        for line in f:
+            num_of_columns = line.count(',') + 1
+            if line.startswith('Vehicle id,') or num_of_columns == 8:
+                return num_of_columns
+    return 5
+
+
+def read_csv_files(statistics_dir, columns):
+    # Mode column: <preemption mode>-<reset mode>-pr<preemption range>-tfd<max number of vehicles>
+    mode_pattern = re.compile(r'^(\w+)-(\w+)-pr([\d.]+)-tfd([\d.]+)$')
+    rows = []
+    for file_name in sorted(glob.glob(os.path.join(statistics_dir, 'route_*.csv'))):
+        route = os.path.basename(file_name)[len('route_'):-len('.csv')]
+        num_of_columns = get_num_of_columns(file_name)
+        with open(file_name) as f:
+            for line in f:
+                fields = line.rstrip('\n').split(',')
+                # Trips of a two-way route without finished return trip are not comparable
+                if len(fields) != num_of_columns or fields[0] == 'Vehicle id':
+                    continue
+                match = mode_pattern.match(fields[1])
+                if match is None:
+                    continue
+                try:
+                    duration = float(fields[4]) + (float(fields[7]) if num_of_columns == 8 else 0.)
+                except ValueError:
+                    continue
+                rows.append((route, float(match.group(4)), float(match.group(3)),
+                             PreemptionMode[match.group(1)].value, ResetMode[match.group(2)].value, duration))
+                if len(rows) >= Columns.batch_size:
+                    columns.add_rows(rows)
+                    rows = []
+    columns.add_rows(rows)
+
+
+def read_database(database_file, columns):
+    db = sqlite3.connect(database_file)
+    try:
+        # Routes with any return trip are two-way, their trips without finished return trip are skipped
+        cursor = db.execute('SELECT CAST(route AS TEXT), density, preemption_range, preemption_mode, reset_mode, '
+                            'duration + IFNULL(return_duration, 0) FROM route_trips WHERE duration IS NOT NULL '
+                            'AND (return_duration IS NOT NULL OR route NOT IN '
+                            '(SELECT route FROM route_trips WHERE return_duration IS NOT NULL))')
+        while True:
+            rows = cursor.fetchmany(Columns.batch_size)
+            if not rows:
+                break
+            columns.add_rows([(str(row[0]), float(row[1]), float(row[2])) + tuple(row[3:]) for row in rows])
+    finally:
+        db.close()
+
+
+def group(keys, durations):
+    """ Returns unique keys and group start indexes of durations sorted by group and duration. """
+    order = np.lexsort((durations,) + tuple(keys[:, i] for i in reversed(range(0, keys.shape[1]))))
+    keys = keys[order]
+    durations = durations[order]
+    starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)]) if len(keys) else np.array([], int)
+    return keys[starts], starts, durations
+
+
+def bootstrap_relative_change(durations, baseline, num_of_samples, random_state, confidence=0.95):
+    """ Confidence interval of mean(durations) / mean(baseline) - 1, resampled in batches of bounded size. """
+    changes = []
+    batch = max(1, bootstrap_cells // max(len(durations), len(baseline)))
+    for start in range(0, num_of_samples, batch):
+        size = min(batch, num_of_samples - start)
+        means = durations[random_state.randint(0, len(durations), (size, len(durations)))].mean(axis=1)
+        baseline_means = baseline[random_state.randint(0, len(baseline), (size, len(baseline)))].mean(axis=1)
+        changes.append(means / baseline_means - 1)
+    changes = np.concatenate(changes)
+    alpha = (1 - confidence) / 2 * 100
+    return np.percentile(changes, alpha), np.percentile(changes, 100 - alpha)
+
+
+def get_group_percentile(durations, starts, counts, percentile):
+    """ Linearly interpolated percentile of every group, durations are sorted within groups. """
+    position = (counts - 1) * percentile / 100.
+    lower = starts + np.floor(position).astype(int)
+    upper = starts + np.ceil(position).astype(int)
+    return durations[lower] + (position % 1) * (durations[upper] - durations[lower])
+
+
+def aggregate(columns, num_of_samples, seed):
+    keys, durations = columns.get_arrays()
+    unique_keys, starts, durations = group(keys, durations)
+    ends = np.r_[starts[1:], len(durations)]
+    counts = ends - starts
+    means = np.add.reduceat(durations, starts) / counts if len(starts) else np.array([])
+    group_percentiles = np.column_stack([get_group_percentile(durations, starts, counts, p) for p in percentiles]) \
+        if len(starts) else np.zeros((0, len(percentiles)))
+
+    # Baseline of (route, density, preemption range) is NONE mode, with standard reset mode if it was run
+    mode_column = key_columns.index('preemption_mode')
+    reset_column = key_columns.index('reset_mode')
+    none_code = columns.codes[mode_column].get(PreemptionMode.NONE.value)
+    standard_code = columns.codes[reset_column].get(ResetMode.STANDARD.value)
+    baselines = {}
+    for i, key in enumerate(unique_keys):
+        if key[mode_column] == none_code:
+            if tuple(key[:mode_column]) not in baselines or key[reset_column] == standard_code:
+                baselines[tuple(key[:mode_column])] = i
+
+    random_state = np.random.RandomState(seed)
+    rows = []
+    for i, key in enumerate(unique_keys):
+        values = [columns.values[c][code] for c, code in enumerate(key)]
+        row = values + [counts[i], means[i]] + group_percentiles[i].tolist()
+        baseline = baselines.get(tuple(key[:mode_column]))
+        if baseline is None or baseline == i:
+            row += [None, None, None]
+        else:
+            change = means[i] / means[baseline] - 1
+            ci_low, ci_high = bootstrap_relative_change(durations[starts[i]:ends[i]],
+                                                        durations[starts[baseline]:ends[baseline]],
+                                                        num_of_samples, random_state)
+            row += [change, ci_low, ci_high]
+        rows.append(row)
+    return rows
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return '{:.4f}'.format(value)
+    return str(value)
+
+
+def main(argv):
+    statistics_dir = None
+    database_file = None
+    output_file = None
+    num_of_samples = 1000
+    seed = 0
+    usage = 'aggregate_results.py (-s <statistics_dir> | -d <results.sqlite>) [-o <output.csv>] [-b <bootstrap samples>]'
+    try:
+        opts, args = getopt.getopt(argv, "hs:d:o:b:", ["statistics=", "database=", "output=", "bootstrap="])
+    except getopt.GetoptError:
+        print usage
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print usage
+            sys.exit()
+        elif opt in ("-s", "--statistics"):
+            statistics_dir = arg
+        elif opt in ("-d", "--database"):
+            database_file = arg
+        elif opt in ("-o", "--output"):
+            output_file = arg
+        elif opt in ("-b", "--bootstrap"):
+            num_of_samples = int(arg)
+    if statistics_dir is None and database_file is None:
+        print usage
+        sys.exit(2)
+
+    columns = Columns()
+    if statistics_dir is not None:
+        read_csv_files(statistics_dir, columns)
+    if database_file is not None:
+        read_database(database_file, columns)
+
+    rows = aggregate(columns, num_of_samples, seed)
+    out = open(output_file, 'w') if output_file else sys.stdout
+    try:
+        out.write(','.join(key_columns + ['trips', 'mean'] + ['p{}'.format(p) for p in percentiles] +
+                           ['change_vs_none', 'change_ci_low', 'change_ci_high']) + '\n')
+        for row in rows:
+            values = list(row)
+            mode_column = key_columns.index('preemption_mode')
+            reset_column = key_columns.index('reset_mode')
+            values[mode_column] = PreemptionMode(values[mode_column]).name
+            values[reset_column] = ResetMode(values[reset_column]).name
+            out.write(','.join([str(value) for value in values[:len(key_columns)]] +
+                               [format_value(value) for value in values[len(key_columns):]]) + '\n')
+    finally:
+        if output_file:
+            out.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+"""
+Per-step controller overhead of VehicleService as the number of intervention vehicles grows.
+State-partitioned VehicleService is compared with scanning all vehicles every step (previous implementation).
+SUMO is not needed, vehicles are lightweight stand-ins driven through insertion, activity and arrival.
+"""
+import os
+import sys
+import time
+import random
+import getopt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulation'))
+from vehicleservice import VehicleService
+from settings import PreemptionMode
+
+
+class BenchmarkVehicle:
+    def __init__(self, vehicle_id, start_delay, trip_duration, preemption_mode):
+        self.id = vehicle_id
+        self.route_name = str(vehicle_id % 6)
+        self.start_delay = start_delay
+        self.arrival_step = start_delay + trip_duration
+        self.preemption_mode = preemption_mode
+        self.is_active = False
+        self.is_finished = False
+
+
+def create_vehicles(num_of_vehicles, num_of_steps):
+    random.seed(num_of_vehicles)
+    modes = list(PreemptionMode)
+    return [BenchmarkVehicle(i, random.randint(0, num_of_steps / 2), random.randint(50, num_of_steps / 2),
+                             modes[i % len(modes)]) for i in range(0, num_of_vehicles)]
+
+
+def run_partitioned(vehicles, num_of_steps):
+    service = VehicleService({'routes': [], 'vehicles': []}, None, None)
+    for vehicle in vehicles:
+        service.add_vehicle(vehicle)
+    arrivals = {}
+    for vehicle in vehicles:
+        arrivals.setdefault(vehicle.arrival_step, []).append(vehicle)
+
+    start = time.time()
+    for step in range(0, num_of_steps):
+        for vehicle in service.pop_vehicles_to_insert(step):
+            service.activate(vehicle)
+        for vehicle in arrivals.get(step, []):
+            if vehicle.is_active:
+                service.deactivate(vehicle, True)
+        service.get_none_preemption_vehicles()
+        service.get_vehicles_to_preempt()
+        service.get_active_vehicles()
+        service.is_any_non_finished_vehicle()
+    return (time.time() - start) / num_of_steps
+
+
+def run_scanning(vehicles, num_of_steps):
+    vehicle_map = {vehicle.id: vehicle for vehicle in vehicles}
+    vehicle_queue = {vehicle.id: vehicle.start_delay for vehicle in vehicles}
+    arrivals = {}
+    for vehicle in vehicles:
+        arrivals.setdefault(vehicle.arrival_step, []).append(vehicle.id)
+
+    start = time.time()
+    for step in range(0, num_of_steps):
+        if step in vehicle_queue.values():
+            for vehicle_id, v in vehicle_queue.items():
+                if v == step:
+                    vehicle_map[vehicle_id].is_active = True
+                    vehicle_queue.pop(vehicle_id, None)
+        arrived = arrivals.get(step, [])
+        for vehicle_id, vehicle in vehicle_map.items():
+            if vehicle_id in arrived and vehicle.is_active:
+                vehicle.is_active = False
+                vehicle.is_finished = True
+        [v for v in vehicle_map.values() if v.is_active and v.preemption_mode is PreemptionMode.NONE]
+        [v for v in vehicle_map.values() if v.is_active and v.preemption_mode is not PreemptionMode.NONE]
+        [v for v in vehicle_map.values() if v.is_active]
+        not all([v.is_finished for v in vehicle_map.values()])
+    return (time.time() - start) / num_of_steps
+
+
+def main(argv):
+    num_of_steps = 2000
+    fleet_sizes = [10, 100, 1000, 5000]
+    try:
+        opts, args = getopt.getopt(argv, "hs:n:", ["steps=", "fleet="])
+    except getopt.GetoptError:
+        print 'fleet_benchmark.py -s <num_of_steps> -n <fleet_size,fleet_size,...>'
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print 'fleet_benchmark.py -s <num_of_steps> -n <fleet_size,fleet_size,...>'
+            sys.exit()
+        elif opt in ("-s", "--steps"):
+            num_of_steps = int(arg)
+        elif opt in ("-n", "--fleet"):
+            fleet_sizes = [int(n) for n in arg.split(',')]
+
+    print "Fleet size,Scanning [us/step],Partitioned [us/step],Speedup"
+    for fleet_size in fleet_sizes:
+        scanning = run_scanning(create_vehicles(fleet_size, num_of_steps), num_of_steps)
+        partitioned = run_partitioned(create_vehicles(fleet_size, num_of_steps), num_of_steps)
+        print "{},{:.1f},{:.1f},{:.1f}x".format(fleet_size, scanning * 1e6, partitioned * 1e6,
+                                                scanning / partitioned if partitioned > 0 else 0)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+"""
+Memory of per-vehicle and per-request objects. Slotted models are compared with dict-backed replicas holding
+the same attribute values (previous implementation), so only object overhead is measured, not shared values.
+SUMO is not needed, vehicles are created without route and connections.
+"""
+import os
+import sys
+import getopt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulation'))
+from intervention_vehicle import InterventionVehicle
+from preemption_request import PreemptionRequest, ResetRequest, RtcLogEntry
+from settings import PreemptionMode, ResetMode
+
+
+class DictBacked:
+    pass
+
+
+def to_dict_backed(obj):
+    replica = DictBacked()
+    for name in obj.__slots__:
+        replica.__dict__[name] = getattr(obj, name)
+    return replica
+
+
+def get_object_size(obj):
+    size = sys.getsizeof(obj)
+    # namedtuples expose __dict__ as a property built on access, slotted objects do not own one
+    if not hasattr(type(obj), '__slots__') and hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def create_vehicles(num_of_vehicles):
+    route_data = {'id': '0', 'start_node': 'a', 'destination_node': 'b', 'is_one_way': True, 'preemption_range': 250}
+    return [InterventionVehicle(None, None, route_data, i, 1, 1, 1, 1) for i in range(0, num_of_vehicles)]
+
+
+def create_requests(num_of_requests):
+    requests = []
+    for i in range(0, num_of_requests):
+        requests.append(PreemptionRequest(i, 'vehicle', 'tl', 100., PreemptionMode.MEDIATE, 'log'))
+        requests.append(ResetRequest(i, ResetMode.STANDARD, 'tl', 'vehicle', 0))
+    return requests
+
+
+def create_logs(num_of_requests):
+    return [RtcLogEntry(i, 'vehicle', 'preemption', 'tl', 'MEDIATE', 'log') for i in range(0, num_of_requests)]
+
+
+def measure_vehicles(num_of_vehicles):
+    slotted = 0
+    dict_backed = 0
+    for vehicle in create_vehicles(num_of_vehicles):
+        slotted += get_object_size(vehicle) + get_object_size(vehicle.stats)
+        dict_backed += get_object_size(to_dict_backed(vehicle)) + get_object_size(to_dict_backed(vehicle.stats))
+    return dict_backed, slotted
+
+
+def measure_requests(num_of_requests):
+    requests = create_requests(num_of_requests)
+    slotted = sum([get_object_size(r) for r in requests])
+    dict_backed = sum([get_object_size(to_dict_backed(r)) for r in requests])
+    return dict_backed, slotted
+
+
+def measure_logs(num_of_requests):
+    logs = create_logs(num_of_requests)
+    slotted = sum([get_object_size(entry) for entry in logs])
+    dict_backed = sum([get_object_size(dict(zip(entry._fields, entry))) for entry in logs])
+    return dict_backed, slotted
+
+
+def main(argv):
+    num_of_vehicles = 1000
+    num_of_requests = 100000
+    try:
+        opts, args = getopt.getopt(argv, "hv:r:", ["vehicles=", "requests="])
+    except getopt.GetoptError:
+        print 'memory_benchmark.py -v <num_of_vehicles> -r <num_of_requests>'
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print 'memory_benchmark.py -v <num_of_vehicles> -r <num_of_requests>'
+            sys.exit()
+        elif opt in ("-v", "--vehicles"):
+            num_of_vehicles = int(arg)
+        elif opt in ("-r", "--requests"):
+            num_of_requests = int(arg)
+
+    print "Objects,Count,Dict-backed [kB],Slotted [kB],Ratio"
+    rows = [('Vehicles + stats', num_of_vehicles, measure_vehicles(num_of_vehicles)),
+            ('Preemption + reset requests', num_of_requests, measure_requests(num_of_requests)),
+            ('RTC log entries', num_of_requests, measure_logs(num_of_requests))]
+    for name, count, (dict_backed, slotted) in rows:
+        print "{},{},{:.1f},{:.1f},{:.1f}x".format(name, count, dict_backed / 1024., slotted / 1024.,
+                                                   float(dict_backed) / slotted if slotted > 0 else 0)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+"""
+Cold import time of simulation modules, as paid by every new worker process.
+Each module is imported in a fresh interpreter, time is the median of the repeats.
+Modules which pull matplotlib (plotter) are listed to compare with the simulation import chain.
+"""
+import os
+import sys
+import getopt
+import subprocess
+
+SIMULATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulation')
+MODULES = ['settings', 'vehicle_stats', 'path_finder', 'road_traffic_control', 'simulation_runner',
+           'parallel_runner', 'plotter']
+IMPORT_SNIPPET = "import time; start = time.time(); import {}; print(time.time() - start)"
+
+
+def measure_import(module, repeats):
+    times = []
+    for i in range(0, repeats):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_SNIPPET.format(module)], cwd=SIMULATION_DIR)
+        times.append(float(output.strip().splitlines()[-1]))
+    return sorted(times)[len(times) / 2]
+
+
+def main(argv):
+    repeats = 5
+    modules = MODULES
+    try:
+        opts, args = getopt.getopt(argv, "hr:m:", ["repeats=", "modules="])
+    except getopt.GetoptError:
+        print 'startup_benchmark.py -r <repeats> -m <module,module,...>'
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print 'startup_benchmark.py -r <repeats> -m <module,module,...>'
+            sys.exit()
+        elif opt in ("-r", "--repeats"):
+            repeats = int(arg)
+        elif opt in ("-m", "--modules"):
+            modules = arg.split(',')
+
+    print "Module,Import [ms]"
+    for module in modules:
+        try:
+            print "{},{:.1f}".format(module, measure_import(module, repeats) * 1000)
+        except subprocess.CalledProcessError:
+            print "{},failed".format(module)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])